@@ -0,0 +1,241 @@
+# bench.py
+
+# End-to-end benchmark of the provisioning pipeline against stub system commands.
+#
+#   python benchmarks/bench.py --repeat 3 --jobs 4 --latency 0.05
+#
+# Every repetition provisions a fresh workspace three times:
+#   cold   empty home folder, caches and workspace
+#   warm   caches kept, workspace (project, venv, node_modules, state) removed
+#   noop   everything kept, nothing changed since the previous run
+
+# Import necessary modules
+import os, sys, json, time, shutil, signal, argparse, tempfile, statistics, subprocess
+from shim import fake_project
+
+# Folder holding the repository under test
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHIM = os.path.join(REPO, "benchmarks", "shim.py")
+
+# Commands replaced by the shim
+SHIMMED = ["sudo", "pacman", "makepkg", "mariadb", "mariadb-install-db", "systemctl", "git", "pip", "npm", "npx"]
+
+# Scenarios in the order they run within one repetition
+SCENARIOS = ["cold", "warm", "noop"]
+
+# Name of the copy of the repository inside the workspace
+BUILD_NAME = "build-bench"
+
+# Files and folders of the workspace that the warm scenario removes
+WORKSPACE_ENTRIES = ["benchProject", "venv", "node_modules", "package.json", "package-lock.json", ".env", ".build_state.json", ".build_trace.json"]
+
+# Write one wrapper per shimmed command into bin_dir
+def install_shims(bin_dir):
+    os.makedirs(bin_dir, exist_ok=True)
+    for command in SHIMMED:
+        path = os.path.join(bin_dir, command)
+        with open(path, "w") as file:
+            file.write(f'#!/bin/sh\nexec "{sys.executable}" "{SHIM}" {command} "$@"\n')
+        os.chmod(path, 0o755)
+
+# Lay out a fresh home folder and workspace under root
+def create_sandbox(root):
+    home = os.path.join(root, "home")
+    workspace = os.path.join(root, "workspace")
+    state = os.path.join(root, "state")
+    for path in (home, workspace, state, os.path.join(root, "datadir")):
+        os.makedirs(path, exist_ok=True)
+    with open(os.path.join(home, ".bashrc"), "w") as file:
+        file.write("# bench bashrc\n")
+    install_shims(os.path.join(root, "bin"))
+    create_origin(os.path.join(root, "origin", "benchProject"))
+    return home, workspace, state
+
+# Create the repository the project is cloned from
+def create_origin(origin):
+    fake_project(origin)
+    identity = ["-c", "user.name=Bench", "-c", "user.email=bench@example.com"]
+    for command in (["init", "-q", "-b", "Master"], ["add", "-A"], [*identity, "commit", "-q", "-m", "Initial commit"]):
+        subprocess.run(["git", *command], cwd=origin, check=True)
+
+# Copy the repository into the workspace with a .env pointing at the sandbox
+def stage_build(root, workspace):
+    build_dir = os.path.join(workspace, BUILD_NAME)
+    if os.path.exists(build_dir):
+        shutil.rmtree(build_dir)
+    shutil.copytree(REPO, build_dir, ignore=shutil.ignore_patterns(".git", "__pycache__", "benchmarks", "requests.jsonl"))
+    with open(os.path.join(build_dir, "scripts", ".env"), "w") as file:
+        file.write("\n".join([
+            "FULL_USER_NAME=Bench User",
+            "GIT_EMAIL=bench@example.com",
+            "PROJECT_NAME=benchProject",
+            f"PROJECT_REPO=file://{os.path.join(root, 'origin', 'benchProject')}",
+            "DB_NAME=benchDatabase",
+            "DB_USER=root",
+            "DB_PASSWORD=bench",
+            f"MARIADB_SOCKET={os.path.join(root, 'state', 'mysqld.sock')}",
+            f"MARIADB_DATADIR={os.path.join(root, 'datadir')}",
+            "MARIADB_START_TIMEOUT=10",
+        ]) + "\n")
+    return build_dir
+
+# Remove the project workspace but keep the home folder and its caches
+def reset_workspace(workspace):
+    for name in WORKSPACE_ENTRIES:
+        path = os.path.join(workspace, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        elif os.path.lexists(path):
+            os.remove(path)
+
+# Stop the fake mysqld started by the systemctl shim
+def stop_server(state):
+    pid_path = os.path.join(state, "mysqld.pid")
+    if os.path.exists(pid_path):
+        with open(pid_path, "r") as file:
+            pid = int(file.read().strip() or 0)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except (OSError, ValueError):
+            pass
+        os.remove(pid_path)
+    socket_path = os.path.join(state, "mysqld.sock")
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+# Provision the workspace once and return the overall and per-step wall times
+def run_once(root, home, workspace, state, args):
+    build_dir = stage_build(root, workspace)
+    env = dict(os.environ)
+    env.update({
+        "HOME": home,
+        "PATH": os.path.join(root, "bin") + os.pathsep + env.get("PATH", ""),
+        "BENCH_STATE": state,
+        "BENCH_BIN": os.path.join(root, "bin"),
+        "BENCH_LATENCY": str(args.latency),
+        "BENCH_MARIADB_SOCKET": os.path.join(state, "mysqld.sock"),
+        # The venv's pip is run as python -m pip, which PATH alone cannot redirect
+        "BUILD_PIP": os.path.join(root, "bin", "pip"),
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+    env.pop("BUILD_CACHE_DIR", None)
+    env.pop("VIRTUAL_ENV", None)
+
+    command = [sys.executable, "core.py", "linux", "arch linux", f"{BUILD_NAME}/scripts/.env", BUILD_NAME]
+    if args.jobs:
+        command += ["--jobs", str(args.jobs)]
+
+    start = time.perf_counter()
+    process = subprocess.run(command, cwd=build_dir, env=env, stdin=subprocess.DEVNULL, capture_output=not args.verbose, text=True)
+    wall = time.perf_counter() - start
+
+    if process.returncode != 0:
+        print(process.stdout or "", process.stderr or "", file=sys.stderr)
+        raise RuntimeError(f"provisioning exited with status {process.returncode}")
+
+    steps = {}
+    trace_path = os.path.join(workspace, ".build_trace.json")
+    if os.path.exists(trace_path):
+        with open(trace_path, "r") as file:
+            for event in json.load(file)["traceEvents"]:
+                if event["cat"] == "step":
+                    steps[event["name"]] = event["dur"] / 1e6
+    return {"wall": wall, "steps": steps}
+
+# Shimmed commands the call log of a repetition never mentions, which would leave their settings without effect
+def unused_shims(state):
+    called = set()
+    calls_path = os.path.join(state, "calls.jsonl")
+    if os.path.exists(calls_path):
+        with open(calls_path, "r") as file:
+            called = {json.loads(line)["command"] for line in file if line.strip()}
+    return [command for command in SHIMMED if command not in called]
+
+# Run every scenario of one repetition in a fresh sandbox
+def run_repetition(args):
+    root = tempfile.mkdtemp(prefix="build-bench-")
+    home, workspace, state = create_sandbox(root)
+    results = {}
+    try:
+        results["cold"] = run_once(root, home, workspace, state, args)
+        reset_workspace(workspace)
+        results["warm"] = run_once(root, home, workspace, state, args)
+        results["noop"] = run_once(root, home, workspace, state, args)
+        unused = unused_shims(state)
+        if unused:
+            print(f"warning: shims never called -- {', '.join(unused)}")
+    finally:
+        stop_server(state)
+        if args.keep:
+            print(f"sandbox kept at {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+    return results
+
+# Median wall time of every scenario and step over all repetitions
+def summarize(repetitions):
+    summary = {}
+    for scenario in SCENARIOS:
+        runs = [repetition[scenario] for repetition in repetitions]
+        step_names = sorted({name for run in runs for name in run["steps"]})
+        summary[scenario] = {
+            "wall": statistics.median(run["wall"] for run in runs),
+            "steps": {name: statistics.median(run["steps"].get(name, 0.0) for run in runs) for name in step_names},
+        }
+    return summary
+
+# Load the earlier results of the benchmark
+def load_history(path):
+    history = []
+    if os.path.exists(path):
+        with open(path, "r") as file:
+            history = [json.loads(line) for line in file if line.strip()]
+    return history
+
+# Print the results next to the median of earlier results and flag regressions
+def print_summary(summary, history, threshold):
+    regressions = []
+    for scenario in SCENARIOS:
+        previous = [entry["summary"][scenario]["wall"] for entry in history if scenario in entry.get("summary", {})]
+        baseline = statistics.median(previous) if previous else None
+        current = summary[scenario]["wall"]
+        marker = ""
+        if baseline is not None:
+            marker = f"  (baseline {baseline:.2f}s)"
+            if current > baseline * threshold:
+                marker += "  REGRESSION"
+                regressions.append(scenario)
+        print(f"{scenario:>5}: {current:7.2f}s{marker}")
+        for name, wall in sorted(summary[scenario]["steps"].items(), key=lambda item: item[1], reverse=True):
+            print(f"         {wall:7.2f}s  {name}")
+    return regressions
+
+# Parse the command-line arguments
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark core.py against stub system commands.")
+    parser.add_argument("--repeat", type=int, default=3, help="number of repetitions of every scenario")
+    parser.add_argument("--jobs", type=int, default=None, help="value passed to core.py --jobs")
+    parser.add_argument("--latency", type=float, default=0.05, help="default latency of every shimmed command in seconds")
+    parser.add_argument("--history", default=os.path.join(os.path.expanduser("~"), ".cache", "build", "bench_history.jsonl"), help="file the results are appended to")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown against the historical median reported as a regression")
+    parser.add_argument("--keep", action="store_true", help="keep the sandbox folders for inspection")
+    parser.add_argument("--verbose", action="store_true", help="show the output of core.py")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    repetitions = [run_repetition(args) for _ in range(args.repeat)]
+    summary = summarize(repetitions)
+
+    history = load_history(args.history)
+    regressions = print_summary(summary, history, args.threshold)
+
+    # Keep the results so later runs are compared against them
+    os.makedirs(os.path.dirname(args.history) or ".", exist_ok=True)
+    with open(args.history, "a") as file:
+        file.write(json.dumps({"time": time.time(), "jobs": args.jobs, "latency": args.latency, "repeat": args.repeat, "summary": summary}) + "\n")
+
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
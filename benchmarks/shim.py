@@ -0,0 +1,188 @@
+# shim.py
+
+# Stand-in for the system commands the provisioning pipeline calls.
+# Invoked as: python shim.py <command> [args...]
+#
+# BENCH_LATENCY / BENCH_LATENCY_<COMMAND>  seconds to sleep before answering
+# BENCH_FAIL_<COMMAND>                     probability (0-1) of failing with exit status 1
+# BENCH_STATE                              folder holding the fake system state and the call log
+
+# Import necessary modules
+import os, sys, json, time, random, socket, signal, subprocess
+
+# Folder holding the fake system state
+STATE = os.environ.get("BENCH_STATE", os.getcwd())
+
+# Environment variable suffix for a command name
+def env_name(command):
+    return command.upper().replace("-", "_").replace(".", "_")
+
+# Sleep and fail as configured for a command
+def inject(command):
+    latency = float(os.environ.get(f"BENCH_LATENCY_{env_name(command)}", os.environ.get("BENCH_LATENCY", "0")))
+    if latency > 0:
+        time.sleep(latency)
+    failure_rate = float(os.environ.get(f"BENCH_FAIL_{env_name(command)}", "0"))
+    if failure_rate > 0 and random.random() < failure_rate:
+        print(f"{command}: injected failure", file=sys.stderr)
+        sys.exit(1)
+
+# Append a call to the log
+def log_call(command, args):
+    with open(os.path.join(STATE, "calls.jsonl"), "a") as file:
+        file.write(json.dumps({"command": command, "args": args, "time": time.time()}) + "\n")
+
+# Read and write the fake set of installed packages
+def installed_packages():
+    path = os.path.join(STATE, "packages.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as file:
+        return json.load(file)
+
+def save_packages(packages):
+    with open(os.path.join(STATE, "packages.json"), "w") as file:
+        json.dump(packages, file)
+
+# Write a file, creating its folder first
+def write(path, content):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as file:
+        file.write(content)
+
+# Create a small Django-like project where a clone would put it
+def fake_project(destination):
+    manage_latency = os.environ.get("BENCH_LATENCY_MANAGE", "0.2")
+    write(os.path.join(destination, "build", "requirements.txt"), "")
+    write(os.path.join(destination, "build", "package.json"), json.dumps({"name": "bench", "version": "1.0.0", "private": True}, indent=2) + "\n")
+    write(os.path.join(destination, "build", "env.txt"), "DEBUG=True\n")
+    write(os.path.join(destination, "app", "models.py"), "# models\n")
+    write(os.path.join(destination, "app", "migrations", "__init__.py"), "")
+    write(os.path.join(destination, "app", "migrations", "0001_initial.py"), "# initial\n")
+    write(os.path.join(destination, "static", "webpack", "webpack.config.js"), "module.exports = {entry: '../js/index.js'};\n")
+    write(os.path.join(destination, "static", "js", "index.js"), "console.log('bench');\n")
+    write(os.path.join(destination, "manage.py"), f"import sys, time\ntime.sleep({manage_latency})\nprint('manage.py', *sys.argv[1:])\n")
+
+# Serve a Unix socket in the background, standing in for mysqld
+def serve_socket(socket_path):
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    while True:
+        connection, _ = server.accept()
+        connection.close()
+
+def sudo(args):
+    # Run the wrapped command as is
+    sys.exit(subprocess.run(args).returncode)
+
+def pacman(args):
+    packages = installed_packages()
+    if args[:1] == ["-Q"] or args[:1] == ["-Qq"]:
+        for name, version in sorted(packages.items()):
+            print(name if args[0] == "-Qq" else f"{name} {version}")
+        return
+    if args and (args[0].startswith("-S") or args[0].startswith("-U")):
+        for name in args[1:]:
+            if not name.startswith("-"):
+                if ".pkg.tar" in name:
+                    name = os.path.basename(name).split(".pkg.tar")[0].rsplit("-", 3)[0]
+                packages.setdefault(name, "1.0-1")
+        save_packages(packages)
+
+def systemctl(args):
+    socket_path = os.environ.get("BENCH_MARIADB_SOCKET", os.path.join(STATE, "mysqld.sock"))
+    if args[:1] == ["is-active"]:
+        print("active" if os.path.exists(socket_path) else "inactive")
+        return
+    if "--now" in args or args[:1] == ["start"]:
+        delay = os.environ.get("BENCH_MARIADB_STARTUP", "0.3")
+        process = subprocess.Popen(
+            [sys.executable, "-c", f"import time, runpy, sys; time.sleep({delay}); sys.argv = ['shim.py', 'mysqld', {socket_path!r}]; runpy.run_path({os.path.abspath(__file__)!r}, run_name='__main__')"],
+            start_new_session=True, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        write(os.path.join(STATE, "mysqld.pid"), str(process.pid))
+
+def mariadb(args):
+    # Echo the marker rows and answer existence checks, like a client in batch mode
+    for line in sys.stdin:
+        line = line.strip()
+        if line.startswith("SELECT '") and line.endswith("';"):
+            print(line[len("SELECT '"):-len("';")])
+        elif line.startswith("SELECT COUNT(*)"):
+            print("1" if os.path.exists(os.path.join(STATE, "database")) else "0")
+        elif line.startswith("CREATE DATABASE"):
+            write(os.path.join(STATE, "database"), "")
+
+def mariadb_install_db(args):
+    for arg in args:
+        if arg.startswith("--datadir="):
+            os.makedirs(os.path.join(arg.split("=", 1)[1], "mysql"), exist_ok=True)
+
+# Locate a real command on PATH, skipping the folder of the shims
+def real_command(name):
+    shim_dir = os.environ.get("BENCH_BIN", "")
+    for entry in os.environ.get("PATH", "").split(os.pathsep):
+        path = os.path.join(entry, name)
+        if os.path.abspath(entry) != os.path.abspath(shim_dir) and os.access(path, os.X_OK):
+            return path
+    return None
+
+def git(args):
+    # AUR revisions and PKGBUILD clones are answered locally, everything else is handled by the real git
+    if args[:1] == ["ls-remote"] and "aur.archlinux.org" in " ".join(args):
+        print(f"{os.environ.get('BENCH_AUR_REVISION', '0' * 40)}\tHEAD")
+        return
+    if args[:1] == ["clone"] and "aur.archlinux.org" in " ".join(args):
+        write(os.path.join(args[-1], "PKGBUILD"), "# bench PKGBUILD\n")
+        return
+    sys.exit(subprocess.run([real_command("git") or "/usr/bin/git", *args]).returncode)
+
+def pip(args):
+    # Build one empty wheel per requirement into the wheelhouse; installing from it changes nothing
+    if args[:1] == ["wheel"] and "-r" in args and "-w" in args:
+        with open(args[args.index("-r") + 1], "r") as file:
+            names = [line.split("#", 1)[0].strip() for line in file]
+        for name in filter(None, names):
+            write(os.path.join(args[args.index("-w") + 1], f"{name.split('=')[0].split('>')[0].split('<')[0]}-1.0-py3-none-any.whl"), "")
+
+def npm(args):
+    if args[:1] in (["install"], ["ci"]):
+        os.makedirs("node_modules", exist_ok=True)
+        if not os.path.exists("package-lock.json"):
+            write("package-lock.json", json.dumps({"lockfileVersion": 3, "packages": {}}) + "\n")
+
+def npx(args):
+    # Bundle the sources into static/dist, as the project's webpack config would
+    if "webpack" in args:
+        write(os.path.join("static", "dist", "main.js"), "// bundle\n")
+
+def makepkg(args):
+    # Drop a package file where makepkg would put it
+    destination = os.environ.get("PKGDEST", os.getcwd())
+    write(os.path.join(destination, f"{os.path.basename(os.getcwd())}-1.0-1-x86_64.pkg.tar.zst"), "")
+
+# Commands without side effects only answer after the configured latency
+HANDLERS = {
+    "sudo": sudo,
+    "pacman": pacman,
+    "makepkg": makepkg,
+    "systemctl": systemctl,
+    "mariadb": mariadb,
+    "mariadb-install-db": mariadb_install_db,
+    "git": git,
+    "pip": pip,
+    "npm": npm,
+    "npx": npx,
+}
+
+if __name__ == "__main__":
+    command, args = sys.argv[1], sys.argv[2:]
+    if command == "mysqld":
+        serve_socket(args[0])
+    log_call(command, args)
+    inject(command)
+    HANDLERS.get(command, lambda args: None)(args)
@@ -1,21 +1,60 @@
 # core.py
 
-import sys
-from main import arch_linux
+import os, argparse
+from main import arch_linux, arch_linux_fleet, arch_linux_export, arch_linux_import, arch_linux_watch
+from scripts.trace import print_report
+from scripts.runner import runner
+
+# Parse the command-line arguments passed by install.sh
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build a project environment.")
+    parser.add_argument("os", nargs="?", default="unknown", help="operating system, 'fleet' to provision every project of a manifest, 'watch' to keep a provisioned project up to date, 'export' or 'import' for an offline bundle, or 'report' to show the run history")
+    parser.add_argument("distribution", nargs="?", default="unknown", help="distribution, the manifest file in fleet mode, the env file in watch mode, or the bundle file")
+    parser.add_argument("env_file_path", nargs="?", default="unknown", help="env file; for export, the one of the provision to bundle (default .env)")
+    parser.add_argument("build_path", nargs="?", default="unknown")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of provisioning steps to run in parallel")
+    parser.add_argument("-c", "--max-commands", type=int, default=None, help="number of external commands allowed to run at the same time")
+    parser.add_argument("--offline", nargs="?", const="", default=None, metavar="BUNDLE", help="provision without network access from imported bundles, importing BUNDLE first")
+    parser.add_argument("--plan", action="store_true", help="probe the host and show what each step would do, without running anything")
+    parser.add_argument("--poll", action="store_true", help="in watch mode, scan the watched files instead of using inotify")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of projects provisioned at the same time in fleet mode")
+    return parser.parse_args(argv)
+
+# Watch the inputs of a provisioned project and re-run the steps they feed; runs until interrupted
+def watch(args):
+    arch_linux_watch(args.distribution, args.jobs, args.poll)
 
 def core():
     # Accessing command-line arguments
-    os_arg = sys.argv[1] if len(sys.argv) > 1 else "unknown"
-    distribution_arg = sys.argv[2] if len(sys.argv) > 2 else "unknown"
-    env_file_path = sys.argv[3] if len(sys.argv) > 3 else "unknown"
-    build_path = sys.argv[4] if len(sys.argv) >4  else "unknown"
+    args = parse_args()
+    runner.set_limit(args.max_commands)
+
+    # Steps and worker processes read the offline switch from the environment
+    if args.offline is not None:
+        os.environ["BUILD_OFFLINE"] = "1"
+        if args.offline:
+            arch_linux_import(args.offline)
 
+    # Show the slowest steps and regressions of recorded runs
+    if args.os == "report":
+        print_report()
+    # Bundle what the provision in the current folder downloaded, or unpack such a bundle
+    elif args.os == "export":
+        arch_linux_export(args.distribution, ".env" if args.env_file_path == "unknown" else args.env_file_path)
+    elif args.os == "import":
+        arch_linux_import(args.distribution)
+    # Re-run the affected steps whenever a watched input changes
+    elif args.os == "watch":
+        watch(args)
+    # Provision every project listed in a manifest
+    elif args.os == "fleet":
+        arch_linux_fleet(args.distribution, args.workers, args.jobs)
     # Check if the operating system is Linux
-    if os_arg == "linux":
+    elif args.os == "linux":
         # Check if the distribution is Arch Linux
-        if distribution_arg == "arch linux":
+        if args.distribution == "arch linux":
             # Call the arch_linux function from the main module
-            arch_linux(env_file_path, build_path)
+            arch_linux(args.env_file_path, args.build_path, args.jobs, args.plan)
     else:
         print(f"This script supports Arch Linux only.")
 
@@ -1,26 +1,255 @@
 # main.py
 
+# Import necessary modules
+import os, time
+
 # Import functions from the scripts.arch_linux module
-from scripts.arch_linux import set_alias, install_packages, config_db_server, clone_project, virtual_environment, install_dependencies, create_configuration, create_migrations, clean_build, summary
+from scripts.arch_linux import set_alias, install_packages, config_db_server, clone_project, virtual_environment, install_dependencies, install_node_modules, build_assets, create_configuration, create_migrations, clean_build, summary, get_env_data, get_alias_path, get_bashrc_path, auth_github, reset_msg_dict, msg_results
+from scripts.scheduler import Step, run_steps
+from scripts.state import StateStore, StepInputs
+from scripts.trace import tracer, record_run
+from scripts.runner import runner, LOG_FILE as COMMAND_LOG
+from scripts.env_config import load_env
+from scripts.bundle import collect_entries, write_bundle, extract_bundle
+from scripts.fleet import ProjectResult, read_manifest, run_fleet, fleet_summary, redirect_output, restore_output, LOG_FILE
+from scripts.watch import create_watcher, affected_steps
+from scripts.preflight import take_snapshot, set_snapshot, print_plan
+from scripts.packages import SYSTEM_PACKAGES, AUR_PACKAGES
+from scripts.asset_cache import WEBPACK_CONFIG
+from scripts.cache import offline_mode
+from scripts.git_sync import project_repo
+
+# Resources the host level steps produce for the project steps
+HOST_RESOURCES = ("aliases", "packages")
+
+# Build the steps that set up the host itself, shared by every project on it
+def host_steps():
+    alias_path = get_alias_path("arch_linux", "linux")
+
+    return [
+        Step("set_alias", set_alias, ("arch_linux", "linux"), outputs=["aliases"],
+             categories=["Aliases"],
+             cache=StepInputs(files=[alias_path], artifacts=[get_bashrc_path()])),
+        Step("install_packages", install_packages, ("pacman",), outputs=["packages"],
+             categories=["Packages"]),
+    ]
+
+# Build the steps that provision one project in the current folder
+def project_steps(env_path):
+    prj_name = get_env_data(env_path, "PROJECT_NAME", "myProject")
+    alias_path = get_alias_path("arch_linux", "linux")
+
+    return [
+        Step("config_db_server", config_db_server, (env_path,), inputs=["packages"], outputs=["database"],
+             categories=["MariaDB", "Database", "Database Password"],
+             cache=StepInputs(env_path, keys=["DB_NAME", "DB_EXTRA_NAMES", "DB_USER", "DB_PASSWORD"])),
+
+        # Project checkout and environment
+        Step("clone_project", clone_project, (env_path,), outputs=["project"],
+             categories=["Github Login", "Clone Project"]),
+        Step("virtual_environment", virtual_environment, outputs=["venv"],
+             categories=["Virtual Environment"]),
+        Step("create_configuration", create_configuration, (env_path,), inputs=["project"], outputs=["configuration"],
+             categories=["Configuration"],
+             cache=StepInputs(env_path, keys=["PROJECT_NAME"], files=[env_path, f"{prj_name}/build/env.txt"], artifacts=[".env"])),
+        Step("install_dependencies", install_dependencies, (env_path,), inputs=["packages", "project", "venv"], outputs=["dependencies"],
+             categories=["Dependencies"],
+             cache=StepInputs(env_path, keys=["PROJECT_NAME"], files=[f"{prj_name}/build/requirements.txt"], artifacts=["venv"])),
+        Step("config_npm", install_node_modules, (env_path,), inputs=["packages", "project"], outputs=["node_modules"],
+             categories=["Node Modules"],
+             cache=StepInputs(env_path, keys=["PROJECT_NAME", "NPM_KEEP_LOCKFILE"], files=[f"{prj_name}/build/package.json", f"{prj_name}/build/package-lock.json"], artifacts=["node_modules"])),
+        # The asset build keeps its own content-hash cache, which also covers node_modules
+        Step("build_assets", build_assets, (env_path,), inputs=["project", "node_modules"], outputs=["assets"],
+             categories=["Assets"]),
+
+        # Generate migrations once the database, configuration and dependencies are ready
+        Step("create_migrations", create_migrations, ("arch_linux", "linux", env_path), inputs=["database", "configuration", "dependencies"], outputs=["migrations"],
+             categories=["Migration"],
+             cache=StepInputs(env_path, keys=["PROJECT_NAME", "DB_NAME"], files=[alias_path, f"{prj_name}/**/migrations/*.py", f"{prj_name}/**/models.py", f"{prj_name}/**/models/*.py"])),
+    ]
+
+# Which inputs watch mode follows, and the steps each of them feeds
+def watch_rules(env_path):
+    prj_name = get_env_data(env_path, "PROJECT_NAME", "myProject")
+
+    return [
+        ([f"{prj_name}/build/requirements.txt"], ["install_dependencies"]),
+        ([f"{prj_name}/build/package.json", f"{prj_name}/build/package-lock.json"], ["config_npm"]),
+        ([env_path, f"{prj_name}/build/env.txt"], ["create_configuration"]),
+        ([f"{prj_name}/**/models.py", f"{prj_name}/**/models/*.py"], ["create_migrations"]),
+        ([get_alias_path("arch_linux", "linux")], ["set_alias"]),
+    ]
+
+# Build the provisioning step graph for an Arch Linux environment
+def arch_linux_steps(env_path, build_path):
+    return host_steps() + project_steps(env_path) + [
+        # The build folder holds alias.txt, so it is removed only after everything else is done
+        Step("clean_build", clean_build, (build_path,), inputs=["aliases", "assets", "migrations"]),
+    ]
+
+# Probe the host and the provisioning folder for one project before any step runs
+def preflight(env_path, build_path=None):
+    prj_name = get_env_data(env_path, "PROJECT_NAME", "myProject")
+    repo_url = project_repo(load_env(env_path))
+    paths = [env_path, ".env", os.path.join("venv", "pyvenv.cfg"), "package.json", "node_modules", prj_name,
+             f"{prj_name}/build/env.txt", os.path.join(prj_name, WEBPACK_CONFIG), get_alias_path("arch_linux", "linux"), get_bashrc_path()]
+    if build_path:
+        paths.append(build_path)
+    return take_snapshot(paths, github="github.com" in repo_url and not offline_mode())
+
+# What each step is going to do, judged from the snapshot
+def plan_notes(env_path, build_path, snapshot):
+    prj_name = get_env_data(env_path, "PROJECT_NAME", "myProject")
+    missing = snapshot.missing(SYSTEM_PACKAGES + ["yay"] + AUR_PACKAGES) if snapshot.packages is not None else None
+    server = "create missing databases" if snapshot.service == "active" else "start mariadb, create missing databases"
+
+    return {
+        "set_alias": f"update {get_bashrc_path()}",
+        "install_packages": "package list unavailable" if missing is None else f"install {', '.join(missing)}" if missing else "all packages installed",
+        "config_db_server": server if snapshot.command("mariadb") or "mariadb" in (missing or []) else "mariadb not installed -- fails",
+        "clone_project": (f"update {prj_name}" if snapshot.exists(prj_name) else f"clone {prj_name}") + (" -- GitHub login required" if snapshot.github is False else ""),
+        "virtual_environment": "keep venv" if snapshot.exists(os.path.join("venv", "pyvenv.cfg")) else "create venv",
+        "create_configuration": "update .env" if snapshot.exists(".env") else "create .env",
+        "install_dependencies": f"install {prj_name}/build/requirements.txt",
+        "config_npm": f"install {prj_name}/build/package.json",
+        "build_assets": "build or restore assets" if snapshot.exists(os.path.join(prj_name, WEBPACK_CONFIG)) else "no webpack config -- skipped",
+        "create_migrations": "makemigrations and migrate",
+        "clean_build": f"remove {build_path}",
+    }
 
 # Build Project for an Arch Linux environment
-def arch_linux(env_path, build_path):
-    # Step 1: Set alias and install system packages
-    set_alias("arch_linux", "linux")
-    install_packages("pacman")
+def arch_linux(env_path, build_path, jobs=None, plan=False):
+    # Every step works relative to the folder that contains the build folder
+    os.chdir("..")
+    tracer.reset()
+    steps = arch_linux_steps(env_path, build_path)
+    prj_name = get_env_data(env_path, "PROJECT_NAME", "myProject")
+
+    # Only show what would be done, leaving the log of the last run in place
+    if plan:
+        snapshot = preflight(env_path, build_path)
+        print_plan(snapshot, steps, StateStore(), plan_notes(env_path, build_path, snapshot))
+        return
 
-    # Step 2: Configure database server and clone the project
-    config_db_server(env_path)
-    clone_project(env_path)
+    # Probe the host once, concurrently, for every step to consult
+    runner.open_log()
+    set_snapshot(preflight(env_path, build_path))
 
-    # Step 3: Set up virtual environment, create configuration, and install dependencies
-    virtual_environment()
-    create_configuration(env_path)
-    install_dependencies(env_path)
+    # Run independent steps concurrently, skipping the ones whose inputs have not changed
+    run_steps(steps, jobs, StateStore())
+    runner.close_log()
 
-    # Step 4: Generate migrations and clean build
-    create_migrations("arch_linux", "linux", env_path)
-    clean_build(build_path)
+    # Keep a timeline of this run and add it to the run history
+    tracer.export()
+    record_run(tracer, prj_name, jobs)
 
     # Final step: Display a summary of the actions performed
     summary()
+
+# Keep a provisioned project up to date, re-running only the steps fed by the files that change
+def arch_linux_watch(env_path, jobs=None, polling=False):
+    # Same working folder as a full run, but the build folder is kept as alias.txt is watched in it
+    os.chdir("..")
+    state = StateStore()
+    rules = watch_rules(env_path)
+    watcher = create_watcher([pattern for patterns, _ in rules for pattern in patterns], polling)
+    print(f"watching {len(rules)} inputs -- press Ctrl-C to stop")
+
+    try:
+        while True:
+            changed = watcher.wait()
+            names = affected_steps(changed, rules)
+            if not names:
+                continue
+
+            # Run just the affected steps; what the others produce is already in place
+            steps = [step for step in host_steps() + project_steps(env_path) if step.name in names]
+            provided = {resource for step in host_steps() + project_steps(env_path) if step.name not in names for resource in step.outputs}
+            print(f"\n{', '.join(sorted(changed))} changed -- running {', '.join(names)}")
+            reset_msg_dict()
+            tracer.reset()
+            runner.open_log()
+            start = time.perf_counter()
+            status = run_steps(steps, jobs, state, provided)
+            runner.close_log()
+
+            failed = [step.name for step in steps if status.get(step.name) not in ('done', 'cached')]
+            if failed:
+                print(f"Error: {', '.join(failed)} failed after {time.perf_counter() - start:.2f}s -- see {COMMAND_LOG}")
+            else:
+                print(f"success: ready in {time.perf_counter() - start:.2f}s")
+    except KeyboardInterrupt:
+        print("\nwatch stopped")
+    finally:
+        watcher.close()
+
+# Provision one project of a fleet inside its own work folder; runs in a worker process
+def provision_project(project, jobs=None):
+    os.makedirs(project.work_dir, exist_ok=True)
+    os.chdir(project.work_dir)
+
+    # Worker processes are reused, so nothing may leak from the previous project
+    reset_msg_dict()
+    tracer.reset()
+    runner.open_log()
+    prj_name = get_env_data(project.env_path, "PROJECT_NAME", "myProject")
+
+    saved = redirect_output(LOG_FILE)
+    start = time.perf_counter()
+    try:
+        steps = run_steps(project_steps(project.env_path), jobs, StateStore(), provided=HOST_RESOURCES)
+        tracer.export()
+        record_run(tracer, prj_name, jobs)
+    finally:
+        wall = time.perf_counter() - start
+        runner.close_log()
+        restore_output(saved)
+
+    return ProjectResult(project, prj_name, steps, msg_results(), tracer.step_times(), wall)
+
+# Provision every project listed in a manifest, sharing the host setup and the caches
+def arch_linux_fleet(manifest_path, workers=None, jobs=None):
+    projects = read_manifest(manifest_path)
+    tracer.reset()
+    repos = [project_repo(load_env(project.env_path)) for project in projects]
+    needs_github = any("github.com" in repo for repo in repos)
+
+    # Probe the host once; worker processes inherit the snapshot
+    set_snapshot(take_snapshot(github=needs_github and not offline_mode()))
+
+    # Set up the host once, before any project needs it
+    status = run_steps(host_steps(), jobs, StateStore(os.path.join(os.path.dirname(os.path.abspath(manifest_path)), ".build_state.json")))
+    if any(status[name] not in ('done', 'cached') for name in status):
+        print("Error: the host could not be set up -- no project provisioned")
+        summary()
+        return []
+
+    # Log in to GitHub up front, as workers cannot prompt for it
+    if needs_github and not offline_mode():
+        auth_github()
+
+    results = run_fleet(projects, provision_project, workers, jobs)
+
+    fleet_summary(results)
+    summary()
+    return results
+
+# Collect everything the provision in the current folder downloaded into a single bundle
+def arch_linux_export(bundle_path, env_path=".env"):
+    config = load_env(env_path)
+    entries = collect_entries(config)
+    manifest = write_bundle(bundle_path, entries, {
+        "project": config.get_str("PROJECT_NAME", ""),
+        "repo": project_repo(config),
+    })
+
+    size_mb = os.path.getsize(bundle_path) / (1024 * 1024)
+    print(f"success: bundle written to {bundle_path} -- {len(manifest['files'])} files in {len(manifest['blobs'])} blobs, {size_mb:.1f} MB")
+    return manifest
+
+# Unpack a bundle into the local caches so that an --offline run can provision from it
+def arch_linux_import(bundle_path):
+    manifest, written, kept = extract_bundle(bundle_path)
+    project = manifest["info"].get("project") or "unknown project"
+    print(f"success: bundle of {project} imported -- {written} files extracted, {kept} already present")
+    return manifest
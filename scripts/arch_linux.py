@@ -1,7 +1,20 @@
 # arch_linux.py
 
 # Import necessary modules
-import os, subprocess, shutil, secrets, string, time
+import os, json, shlex, subprocess, shutil, secrets, string
+from scripts.env_config import load_env
+from scripts.trace import run_process, tracer
+from scripts.django_migrate import REPORT_MARKER, NOT_DJANGO
+from scripts.virtualenv import create_venv, activation_env
+from scripts.venv_cache import prepare_venv, DEFAULT_MAX_MB as VENV_CACHE_MAX_MB
+from scripts.git_sync import sync_repository, project_repo
+from scripts.packages import install_missing, install_aur_package, SYSTEM_PACKAGES, AUR_PACKAGES
+from scripts.mariadb import run_batch, provisioning_statements, bring_up, MARIADB_CLIENT, DATADIR, SOCKET_PATH
+from scripts.npm_cache import prepare_node_modules, DEFAULT_MAX_MB as NPM_CACHE_MAX_MB
+from scripts.asset_cache import prepare_assets, DEFAULT_OUTPUT_DIR as ASSETS_OUTPUT_DIR, DEFAULT_MAX_MB as ASSETS_CACHE_MAX_MB
+from scripts.cache import cache_lock, offline_mode
+from scripts.filesync import sync_content, sync_file, existing_line
+from scripts.preflight import find_command, package_index, github_logged_in
 
 # Initialize a dictionary to store messages with empty sets
 msg_dict = {
@@ -16,6 +29,8 @@ msg_dict = {
     'Configuration': set(),
     'Virtual Environment': set(),
     'Dependencies': set(),
+    'Node Modules': set(),
+    'Assets': set(),
     'Migration': set(),
 }
 
@@ -24,17 +39,30 @@ def update_msg_dict(category, result):
     msg_dict[category].clear()  # Clear the existing set
     msg_dict[category].update({result})
 
-# Implement alias setting based on distro and OS.
-def set_alias(distro, operating_system):
+# Clear every category so the next project starts from a blank summary
+def reset_msg_dict():
+    for messages in msg_dict.values():
+        messages.clear()
+    msg_dict['Initialization'].add('success')
 
-    os.chdir("..")
+# Result of every category that was reported, as a plain dictionary
+def msg_results():
+    return {category: next(iter(messages)) for category, messages in msg_dict.items() if messages}
 
-    # Get the path to the script's directory
+# Get the path to the alias.txt file for a distro and OS relative to the script's directory
+def get_alias_path(distro, operating_system):
     script_directory = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(script_directory, f"os/{operating_system}/{distro}/alias.txt")
+
+# Get the path to the user's .bashrc file
+def get_bashrc_path():
+    return os.path.join(os.path.expanduser("~"), ".bashrc")
 
-    # Specify the path to the alias.txt and .bashrc files relative to the script's directory
-    alias_file_path = os.path.join(script_directory, f"os/{operating_system}/{distro}/alias.txt")
-    bashrc_file_path = os.path.join(os.path.expanduser("~"), ".bashrc")
+# Implement alias setting based on distro and OS.
+def set_alias(distro, operating_system):
+    # Specify the path to the alias.txt and .bashrc files
+    alias_file_path = get_alias_path(distro, operating_system)
+    bashrc_file_path = get_bashrc_path()
 
     # Check if the file exists before attempting to open it
     if os.path.exists(alias_file_path) and os.path.exists(bashrc_file_path):
@@ -50,27 +78,22 @@ def set_alias(distro, operating_system):
         start_marker = "# Aliases"
         end_marker = "# end_alises"
         start_index = bashrc_content.find(start_marker)
-        end_index = bashrc_content.find(end_marker) + len(end_marker)
+        end_index = bashrc_content.find(end_marker)
 
         # Check if the range is found
         if start_index != -1 and end_index != -1:
             # Replace the existing range with the new aliases
-            updated_bashrc_content = f"{bashrc_content[:start_index]}# Aliases\n{alias_content}\n# end_alises{bashrc_content[end_index:]}"
+            updated_bashrc_content = f"{bashrc_content[:start_index]}# Aliases\n{alias_content}\n# end_alises{bashrc_content[end_index + len(end_marker):]}"
         else:
             # Add the new aliases to the end of the file
             updated_bashrc_content = f"{bashrc_content}\n# Aliases\n{alias_content}\n# end_alises"
 
-        # Write the updated content to .bashrc
-        with open(bashrc_file_path, 'w') as bashrc_file:
-            bashrc_file.write(updated_bashrc_content)
-
-        print(f"success: aliases -- updated")
+        # Rewrite .bashrc only when the alias block changed; new shells pick it up on their own
+        if sync_content(bashrc_file_path, updated_bashrc_content):
+            print(f"success: aliases -- updated")
+        else:
+            print(f"warning: aliases already up to date -- skipping")
         update_msg_dict('Aliases', 'updated')
-
-        # Source the updated .bashrc file
-        source_command = f"source {bashrc_file_path}"
-        # You may want to run this command in a subprocess or shell
-        subprocess.run(source_command, shell=True)
     else:
         if not os.path.exists(alias_file_path):
             print(f"Error: File not found - {alias_file_path}")
@@ -81,155 +104,185 @@ def set_alias(distro, operating_system):
 
 # Install essential packages
 def install_packages(pkg_manager):
-    packages = ["firefox", "nodejs", "npm", "base-devel", "mariadb"]
-    install_pkgs_command = ["sudo", pkg_manager, "-Sq", "--needed", "--noconfirm"] + packages
-    subprocess.run(install_pkgs_command)
-
-    # Check if 'yay' is installed
-    if not shutil.which("yay"):
-
-        # Check if yay folder exists and remove it
-        if os.path.exists("yay"):
-            shutil.rmtree("yay")
-
-        # Clone yay repository
-        subprocess.run(["git", "clone", "https://aur.archlinux.org/yay.git"], check=True)
-
-        # Change directory to yay
-        os.chdir("yay")
-
-        # Build and install yay
-        subprocess.run(["makepkg", "-si", "--noconfirm"], check=True)
-
-        # Install additional packages using yay
-        subprocess.run(["yay", "-S", "visual-studio-code-bin", "--noconfirm"], check=True)
-
-        # Change back to the original directory
-        os.chdir("..")
-
-        # Remove yay folder
-        shutil.rmtree("yay")
-
-    update_msg_dict('Packages', 'updated')
-
- # Run a shell command and optionally capture its output
-def run_command(command, capture_output=False):
+    # Start from the packages the preflight snapshot found and install only the missing ones
+    index = package_index(pkg_manager)
+    installed = install_missing(index, SYSTEM_PACKAGES, pkg_manager)
+    if installed is None:
+        print("Error: installing system packages failed")
+        update_msg_dict('Packages', 'failed')
+        return index
+    if installed:
+        print(f"success: packages installed -- {' '.join(installed)}")
+    else:
+        print("warning: system packages already installed -- skipping")
+
+    # Check if 'yay' is installed, building it only for a PKGBUILD revision that is not cached
+    if not index.has("yay") and not find_command("yay"):
+        status = install_aur_package("yay")
+        if status is None:
+            print("Error: installing yay failed")
+            update_msg_dict('Packages', 'failed')
+            return index
+        print(f"success: yay installed -- {status}")
+        index.add(["yay"])
+
+    # Install additional AUR packages through the same build cache, or from their bundled builds when offline
+    missing = index.missing(AUR_PACKAGES)
+    for name in missing:
+        status = install_aur_package(name)
+        if status is None:
+            print(f"Error: installing {name} failed")
+            update_msg_dict('Packages', 'failed')
+            return index
+        print(f"success: {name} installed -- {status}")
+    index.add(missing)
+
+    update_msg_dict('Packages', 'updated' if installed or missing else 'installed')
+    return index
+
+# Longest a single install or migration command may take before it is considered hung
+COMMAND_TIMEOUT = 3600
+
+# Run a command given as an argv list, streaming its output, and optionally capture the tail of it
+def run_command(command, capture_output=False, cwd=None, env=None, timeout=COMMAND_TIMEOUT):
     try:
-        # Execute the shell command
-        result = subprocess.run(command, shell=True, capture_output=capture_output, text=True, check=True)
+        result = run_process(command, capture=capture_output, check=True, cwd=cwd, env=env, timeout=timeout)
         return result.stdout.strip() if capture_output else ""
     except subprocess.CalledProcessError as e:
         print(f"Error executing command: {e}")
-        return "" if capture_output else None
+    except subprocess.TimeoutExpired:
+        print(f"Error: {shlex.join(command)} did not finish within {timeout}s -- stopped")
+    except OSError as e:
+        print(f"Error executing command: {e}")
+    return "" if capture_output else None
 
-# Retrieve data from environment variables with fallback to a default value
+# Retrieve data from the .env file with fallback to a default value
 def get_env_data(env_path, input_key, default):
-    # Check if the .env file exists
-    if os.path.exists(env_path):
-        with open(env_path, "r") as file:
-            for line in file:
-                # Check if the line contains the input key
-                if line.startswith(input_key):
-                    # Extract the value after the '=' and remove surrounding quotes
-                    _, env_input = line.strip().split("=", 1)
-                    result = env_input.strip('\'"')
-                    return result
-
-    # Return the default value if the input key is not found
-    return default
-
-# Start and enable the MariaDB service
-def start_enable_mariadb_service():
-    # Attempt to initialize the system tables
-    subprocess.run(['sudo', 'mariadb-install-db', '--user=mysql', '--basedir=/usr', '--datadir=/var/lib/mysql'])
-
-    # Check if MariaDB service is not active
-    status_output = subprocess.run(['sudo', 'systemctl', 'is-active', 'mariadb.service'], stdout=subprocess.PIPE, text=True)
-    
-    if not status_output.stdout.strip() == "active":
-        # Start and enable MariaDB service if not already running
-        subprocess.run(['sudo', 'systemctl', 'start', 'mariadb.service'])
-        subprocess.run(['sudo', 'systemctl', 'enable', 'mariadb.service'])
-
-        print("success: mariaDB service is started and enabled.")
+    # The file is parsed once and shared until it changes on disk
+    return load_env(env_path).get(input_key, default)
+
+# Start and enable the MariaDB service and wait until it accepts connections
+def start_enable_mariadb_service(config):
+    # Projects provisioned side by side share one server, so only one of them brings it up
+    with cache_lock("mariadb-server"):
+        result = bring_up(
+            datadir=config.get_str("MARIADB_DATADIR", DATADIR),
+            socket_path=config.get_str("MARIADB_SOCKET", SOCKET_PATH),
+            timeout=config.get_float("MARIADB_START_TIMEOUT", 30.0),
+        )
+
+    if result.initialized:
+        print("success: mariaDB system tables initialized.")
+
+    if result.error:
+        print(f"Error: mariaDB could not be started -- {result.error}")
+        update_msg_dict('MariaDB', 'failed')
+    elif not result.ready:
+        print(f"Error: mariaDB did not accept connections within {result.waited:.1f}s")
+        update_msg_dict('MariaDB', 'failed')
+    elif result.started:
+        print(f"success: mariaDB service is started and enabled -- ready after {result.waited:.2f}s")
         update_msg_dict('MariaDB', 'enabled')
     else:
         print("warning: mariaDB service is already running.")
         update_msg_dict('MariaDB', 'running')
 
-# Create a database with the specified name
-def create_database(target_database):
-    # Check if the database exists
-    try:
-        subprocess.run(['sudo', 'mariadb', '-e', f"USE {target_database};"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print(f"warning: {target_database} detected -- skipping ")
-        update_msg_dict('Database', 'updated')
-    except subprocess.CalledProcessError:
-        # If the database doesn't exist, create it
-        try:
-            subprocess.run(['sudo', 'mariadb', '-e', f"CREATE DATABASE {target_database};"])
-            print(f"success: {target_database} created.")
-            update_msg_dict('Database', 'created')
-        except subprocess.CalledProcessError as e:
-            print(f"Error creating database: {e}")
-            update_msg_dict('Database', 'failed')
-
-# Function to set the root password for the MariaDB database
-def set_root_password(new_password):
-    try:
-        # Execute the mariadb command to set the root password
-        command = f"sudo mariadb -e \"SET PASSWORD FOR 'root'@'localhost' = PASSWORD('{new_password}')\""
-        subprocess.run(command, shell=True, check=True)
-
-        # Print a success message and update a message dictionary
+    return result.ready
+
+# Function to provision databases, the application user and the root password in one session
+def provision_databases(databases, root_password, user=None, socket_path=SOCKET_PATH, timeout=120.0):
+    statements = provisioning_statements(databases, root_password, user, root_password)
+    results = run_batch(statements, (*MARIADB_CLIENT, f"--socket={socket_path}"), timeout)
+
+    # Each database contributes an existence check followed by its CREATE statement
+    statuses = []
+    for index, database in enumerate(databases):
+        exists, create = results[2 * index], results[2 * index + 1]
+        if not create.ok:
+            print(f"Error creating database: {create.error}")
+            statuses.append('failed')
+        elif exists.ok and exists.scalar('0') != '0':
+            print(f"warning: {database} detected -- skipping ")
+            statuses.append('updated')
+        else:
+            print(f"success: {database} created.")
+            statuses.append('created')
+
+    # Report failed user and grant statements
+    for result in results[2 * len(databases):-1]:
+        if not result.ok:
+            print(f"Error: {result.error}")
+            statuses.append('failed')
+
+    # A single failure marks the whole category as failed
+    for status in ('failed', 'created', 'updated'):
+        if status in statuses:
+            update_msg_dict('Database', status)
+            break
+
+    # The root password is always the last statement
+    password = results[-1]
+    if password.ok:
         print("success: root password set successfully!")
         update_msg_dict('Database Password', 'success')
-
-    except subprocess.CalledProcessError as e:
-        # Handle errors by printing an error message and updating a message dictionary
-        print(f"Error: {e}")
+    else:
+        print(f"Error: {password.error}")
         update_msg_dict('Database Password', 'failed')
 
+    return results
+
 # Function to configure the database server
 def config_db_server(env_path):
-    # Specify the database, username, and root password
-    target_database = get_env_data(env_path, "DB_NAME", "myDatabase")
-    root_password = get_env_data(env_path, "DB_PASSWORD", "root")
-
-    if shutil.which("mariadb"):
-        # Check if MariaDB service is not active
-        start_enable_mariadb_service()
-        # Create the specified database
-        create_database(target_database)
-        # Set the root password for MariaDB
-        set_root_password(root_password)
+    config = load_env(env_path)
+
+    # Specify the databases, username, and root password
+    target_database = config.get("DB_NAME", "myDatabase")
+    databases = [target_database] + [name for name in config.get_list("DB_EXTRA_NAMES") if name != target_database]
+    root_password = config.get("DB_PASSWORD", "root")
+    db_user = config.get("DB_USER", "root")
+
+    if find_command("mariadb"):
+        # Bring the server up before talking to it
+        if not start_enable_mariadb_service(config):
+            return None
+        # Create the databases and set the passwords in a single client session
+        return provision_databases(databases, root_password, db_user, config.get_str("MARIADB_SOCKET", SOCKET_PATH), config.get_float("MARIADB_QUERY_TIMEOUT", 120.0))
+
+    # Without the client nothing was configured, so the step must not be remembered as done
+    print("Error: mariadb is not installed -- databases not configured")
+    update_msg_dict('MariaDB', 'failed')
+    return None
 
 # Function for GitHub authentication
 def auth_github():
+    # A login found by the preflight snapshot needs no second check
+    if github_logged_in():
+        return True
+
     try:
         # Check GitHub authentication status
-        subprocess.run(["gh", "auth", "status"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        run_process(["gh", "auth", "status"], check=True, capture=True, timeout=60)
 
         # If the above line is successful, it means the user is authenticated
         # Return True to indicate successful authentication
         return True
 
-    except subprocess.CalledProcessError:
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
         # If the above line raises an error, it means the user is not authenticated
         # Prompt for login and retry
         print("You are not authenticated with GitHub. Logging in...")
 
         while True:
             try:
-                # Attempt GitHub authentication
-                subprocess.run(["gh", "auth", "login"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                # Attempt GitHub authentication; gh prompts on the terminal, but not forever
+                run_process(["gh", "auth", "login"], check=True, interactive=True, timeout=600)
                 print("GitHub authentication successful.")
                 update_msg_dict('Github Login', 'success')
 
                 # If authentication is successful, return True
                 return True
 
-            except subprocess.CalledProcessError:
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
                 # If authentication fails, prompt user to retry or exit
                 print("GitHub authentication failed.")
                 update_msg_dict('Github Login', 'failed')
@@ -241,33 +294,51 @@ def auth_github():
                 else:
                     print("Retrying GitHub authentication...")
 
-# Function to clone a project from GitHub
+# Function to clone or update a project from GitHub
 def clone_project(env_path):
-    # Obtain project name and authentication status
-    prj_name = get_env_data(env_path, "PROJECT_NAME", "myProject")
-    is_authenticated = auth_github()
-
-    if is_authenticated:
-        if prj_name:
-            # Check if the project directory exists
-            project_directory = os.path.join(os.getcwd(), prj_name)
-
-            if not os.path.exists(project_directory):
-                # Clone the GitHub repository if the project directory does not exist
-                clone_command = f"git clone -b Master https://github.com/adityathute/{prj_name}.git {prj_name}"
-                subprocess.run(clone_command, shell=True, check=True)
-                print(f"success: {prj_name} cloned successfully!")
-                update_msg_dict('Clone Project', 'success')
-            else:
-                print(f"warning: {prj_name} is already cloned -- skipping")
-                update_msg_dict('Clone Project', 'updated')
+    config = load_env(env_path)
+
+    # Obtain project name and where to clone it from
+    prj_name = config.get("PROJECT_NAME", "myProject")
+    if not prj_name:
+        return
+    repo_url = project_repo(config)
+    branch = config.get_str("PROJECT_BRANCH", "Master")
+
+    # Only GitHub remotes need the gh login, and offline runs only read the local mirror
+    if "github.com" in repo_url and not offline_mode() and not auth_github():
+        return
+
+    # Clone through the local mirror cache, or fast-forward an existing checkout
+    status = sync_repository(
+        repo_url, prj_name, branch,
+        depth=config.get_int("GIT_CLONE_DEPTH", 0),
+        blob_filter=config.get_str("GIT_CLONE_FILTER", "") or None,
+        use_mirror=config.get_bool("GIT_MIRROR", True),
+    )
+
+    if status == 'cloned':
+        print(f"success: {prj_name} cloned successfully!")
+        update_msg_dict('Clone Project', 'success')
+    elif status == 'updated':
+        print(f"success: {prj_name} fast-forwarded to the latest {branch}")
+        update_msg_dict('Clone Project', 'updated')
+    elif status == 'current':
+        print(f"warning: {prj_name} is already up to date -- skipping")
+        update_msg_dict('Clone Project', 'updated')
+    elif status == 'diverged':
+        print(f"warning: {prj_name} has local commits not on {branch} -- not updated")
+        update_msg_dict('Clone Project', 'diverged')
+    else:
+        print(f"Error: could not clone or update {prj_name} from {repo_url}")
+        update_msg_dict('Clone Project', 'failed')
 
 # Function to generate a random secret key
 def generate_secret_key(length=64):
     characters = string.ascii_letters + string.digits + string.punctuation
     return ''.join(secrets.choice(characters) for _ in range(length))
 
-# Function to copy an environment file with optional additional content and a generated secret key
+# Function to copy an environment file with optional additional content and a secret key, keeping an existing one
 def copy_env_file(src_path, dest_path, additional_content=None):
     # Read content from the source file
     with open(src_path, 'r') as src_file:
@@ -277,13 +348,14 @@ def copy_env_file(src_path, dest_path, additional_content=None):
     if additional_content:
         content += '\n' + additional_content
 
-    # Generate and append a secret key line
-    secret_key_line = f'SECRET_KEY="{generate_secret_key()}"\n'
-    content += secret_key_line
+    # Reuse the secret key of an earlier run so the file only changes when its sources do
+    secret_key_line = existing_line(dest_path, "SECRET_KEY") or f'SECRET_KEY="{generate_secret_key()}"'
+    if content and not content.endswith('\n'):
+        content += '\n'
+    content += secret_key_line + '\n'
 
-    # Write the modified content to the destination file
-    with open(dest_path, 'w') as dest_file:
-        dest_file.write(content)
+    # Write the modified content to the destination file, returning whether it changed
+    return sync_content(dest_path, content)
 
 # Function to read content from a file given its path
 def read_content_from_path(file_path):
@@ -299,17 +371,17 @@ def create_configuration(env_path):
 
     # Check if both the environment and project configuration files exist
     if os.path.exists(env_path) and os.path.exists(config_path):
-        if os.path.exists(new_env_path):
-            # If the destination file already exists, overwrite it
-            additional_content = read_content_from_path(config_path)
-            copy_env_file(env_path, new_env_path, additional_content)
-            print(f"success: configuration -- updated")
+        created = not os.path.exists(new_env_path)
+        additional_content = read_content_from_path(config_path)
+        if not copy_env_file(env_path, new_env_path, additional_content):
+            print(f"warning: configuration already up to date -- skipping")
             update_msg_dict('Configuration', 'updated')
-        else:
-            additional_content = read_content_from_path(config_path)
-            copy_env_file(env_path, new_env_path, additional_content)
+        elif created:
             print(f"success: configuration -- created")
             update_msg_dict('Configuration', 'created')
+        else:
+            print(f"success: configuration -- updated")
+            update_msg_dict('Configuration', 'updated')
     else:
         # Check and report errors if either the environment or project configuration file is missing
         if not os.path.exists(env_path):
@@ -321,24 +393,18 @@ def create_configuration(env_path):
 
 # Function to create a virtual environment
 def virtual_environment():
-    if not os.path.exists("venv"):
-        # Create a virtual environment
+    if not os.path.exists(os.path.join("venv", "pyvenv.cfg")):
+        # Create a virtual environment through the venv API and seed pip from the bundled wheel
         print(f"creating virtual environment...")
-        run_command("python -m venv venv")
-        update_msg_dict('Virtual Environment', 'created')
+        if create_venv("venv"):
+            update_msg_dict('Virtual Environment', 'created')
+        else:
+            update_msg_dict('Virtual Environment', 'failed')
     else:
         update_msg_dict('Virtual Environment', 'updated')
 
-    # Activate the virtual environment manually by setting up environment variables
-    activate_script = os.path.join("venv", "bin", "activate")
-    activate_cmd = f"source {activate_script} && env"
-    env_output = run_command(activate_cmd, capture_output=True)
-
-    # Extract environment variables from the activation script output
-    env_vars = {line.split("=", 1)[0]: line.split("=", 1)[1] for line in env_output.splitlines()}
-
-    # Set up the environment variables in the current process
-    os.environ.update(env_vars)
+    # Commands that need the venv get this environment passed explicitly
+    return activation_env("venv")
 
 # Function to remove the package lock file
 def remove_package_lock():
@@ -350,37 +416,70 @@ def remove_package_lock():
         os.remove(pkg_lock_json)
 
 # Function to configure npm for a project
-def config_npm(prj_name):
+def config_npm(prj_name, keep_lockfile=False):
     pkg_json="./package.json"
     pkg_json_location = f"{prj_name}/build/package.json"
+    pkg_lock_location = f"{prj_name}/build/package-lock.json"
 
-    if not os.path.exists(pkg_json):
-        # If not, copy it from the source location
-        remove_package_lock()
-        shutil.copy(pkg_json_location, pkg_json)
-    else:
-        # Read the content of both files
-        with open(pkg_json, 'r') as dest_file, open(pkg_json_location, 'r') as src_file:
-            dest_content = dest_file.read()
-            src_content = src_file.read()
-
-        # Compare content
-        if dest_content != src_content:
+    # Copy package.json only when it differs, so an unchanged one keeps its mtime
+    if sync_file(pkg_json_location, pkg_json):
+        # A kept lockfile is updated by npm instead of being re-resolved from scratch
+        if not keep_lockfile:
             remove_package_lock()
-            # If content is different, update the package.json file
-            shutil.copy(pkg_json_location, pkg_json)
 
-# Function to install project dependencies
+    # A lockfile shipped with the project takes precedence over the local one
+    if keep_lockfile and os.path.exists(pkg_lock_location):
+        sync_file(pkg_lock_location, "./package-lock.json")
+
+# Function to install the project's python dependencies
 def install_dependencies(env_path):
     prj_name = get_env_data(env_path, "PROJECT_NAME", "myProject")
 
-    # Install dependencies from requirements.txt
-    run_command(f"pip install -r {prj_name}/build/requirements.txt")
+    # Install dependencies from requirements.txt, reusing cached wheels and venv templates
+    max_mb = load_env(env_path).get_int("VENV_CACHE_MAX_MB", VENV_CACHE_MAX_MB)
+    pip_result = prepare_venv("venv", f"{prj_name}/build/requirements.txt", run_command, max_mb)
+    if pip_result is not None:
+        print(f"success: python dependencies -- {pip_result}")
+
+    # A failed install must not be remembered as done
+    if pip_result is None:
+        update_msg_dict('Dependencies', 'failed')
+    else:
+        update_msg_dict('Dependencies', 'updated')
+
+# Function to install the project's npm packages
+def install_node_modules(env_path):
+    prj_name = get_env_data(env_path, "PROJECT_NAME", "myProject")
 
-    # Install npm
-    config_npm(prj_name)
-    run_command("npm install")
-    update_msg_dict('Dependencies', 'updated')
+    # Install npm packages, restoring node_modules from the cache when the dependency set is known
+    keep_lockfile = load_env(env_path).get_bool("NPM_KEEP_LOCKFILE", False)
+    config_npm(prj_name, keep_lockfile)
+    npm_result = prepare_node_modules(run_command, ".", keep_lockfile, load_env(env_path).get_int("NPM_CACHE_MAX_MB", NPM_CACHE_MAX_MB))
+    if npm_result is not None:
+        print(f"success: npm dependencies -- {npm_result}")
+
+    if npm_result is None:
+        update_msg_dict('Node Modules', 'failed')
+    else:
+        update_msg_dict('Node Modules', 'updated')
+
+# Function to build the project's front-end assets with webpack
+def build_assets(env_path):
+    config = load_env(env_path)
+    prj_name = config.get_str("PROJECT_NAME", "myProject")
+
+    # Restore the build output from the cache, or run webpack with its persistent cache
+    result = prepare_assets(run_command, prj_name, config.get_str("WEBPACK_OUTPUT_DIR", ASSETS_OUTPUT_DIR), "node_modules", config.get_int("ASSETS_CACHE_MAX_MB", ASSETS_CACHE_MAX_MB))
+    if result is None:
+        update_msg_dict('Assets', 'failed')
+        return
+
+    status, duration = result
+    if status == 'built':
+        print(f"success: assets built in {duration:.2f}s")
+        update_msg_dict('Assets', f"built in {duration:.2f}s")
+    else:
+        update_msg_dict('Assets', status)
 
 # Function to extract the content of the 'adm' function from an alias file
 def extract_adm_function(alias_file_path):
@@ -399,35 +498,63 @@ def extract_adm_function(alias_file_path):
 
     return adm_function_content
 
+# Function to run makemigrations and migrate in one warm Django process
+def run_django_migrations(project_directory, env):
+    python = os.path.join(os.path.abspath("venv"), "bin", "python")
+    migrate_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "django_migrate.py")
+    # Only the tail is kept, which is where the report line is
+    result = run_process([python, migrate_script], cwd=project_directory, env=env, capture=True, timeout=COMMAND_TIMEOUT)
+
+    # Show Django's output and pick the report off the last line
+    report = None
+    for line in result.stdout.splitlines():
+        if line.startswith(REPORT_MARKER):
+            report = json.loads(line[len(REPORT_MARKER):])
+        else:
+            print(line)
+    if result.stderr:
+        print(result.stderr.rstrip())
+
+    if result.returncode == NOT_DJANGO:
+        return None
+    if result.returncode != 0 or report is None:
+        return False
+    return report
+
 # Function to create migrations
 def create_migrations(distro, operating_system, env_path):
     prj_name = get_env_data(env_path, "PROJECT_NAME", "myProject")
 
-    # Get the path to the script's directory
-    script_directory = os.path.dirname(os.path.abspath(__file__))
-
-    # Specify the path to the alias.txt and .bashrc files relative to the script's directory
-    alias_file_path = os.path.join(script_directory, f"os/{operating_system}/{distro}/alias.txt")
-
-    # Extract 'adm' function content
-    adm_function_content = extract_adm_function(alias_file_path)
-
-    # Get the path to the project directory
+    # Get the path to the project directory and the environment of the venv
     project_directory = os.path.join(os.getcwd(), prj_name)
+    venv_env = activation_env("venv")
+
+    # Boot Django once for both makemigrations and migrate
+    report = run_django_migrations(project_directory, venv_env)
+    if report is False:
+        update_msg_dict('Migration', 'failed')
+        return
+    if report is not None:
+        print(f"success: migrations -- {len(report['applied'])} applied of {len(report['planned'])} planned")
+        for migration in report['applied']:
+            print(f"  applied {migration}")
+        update_msg_dict('Migration', 'updated')
+        return
+
+    # Not a Django project the runner understands, run the 'adm' alias line by line instead
+    alias_file_path = get_alias_path(distro, operating_system)
+    adm_function_content = extract_adm_function(alias_file_path)
 
-    # Change the current working directory to the project directory
-    os.chdir(project_directory)
-
-    # Run each line from 'adm' function content as a command
+    # Run each line from 'adm' function content as a command inside the project directory
     for command in adm_function_content:
-        run_command(command)
+        if run_command(shlex.split(command), cwd=project_directory, env=venv_env) is None:
+            update_msg_dict('Migration', 'failed')
+            return
 
     update_msg_dict('Migration', 'updated')
 
 # Function to clean up a build directory
 def clean_build(build_path):
-    os.chdir('..')
-
     if os.path.exists(build_path):
         try:
             # Use shutil.rmtree to delete the folder and its contents
@@ -435,17 +562,19 @@ def clean_build(build_path):
         except Exception as e:
             print(f"Error: {e}")
 
-# Function to animate dots for a specified duration
-def animate_dots(duration):
-    for _ in range(duration):
-        print(".", end='', flush=True)
-        time.sleep(1)
-
 # Function to provide a summary
 def summary():
-    # print("\nSummary:-")
-    # for category, messages in msg_dict.items():
-    #    if messages:  # Check if the set is not empty
-    #         print(f"{category} -- {next(iter(messages))}")  # Print the first element in the set
-    # Displaying a cleaning animation with dots and a final message
-    print("\ncleaning", end='', flush=True); animate_dots(3); print("\n\033[F\033[KAll Done\n", end='', flush=True)
+    step_times = tracer.step_times()
+
+    print("\nSummary:-")
+    for category, messages in msg_dict.items():
+        if messages:  # Check if the set is not empty
+            print(f"{category} -- {next(iter(messages))}")  # Print the first element in the set
+
+    # Show where the time went, slowest step first
+    if step_times:
+        print("\nTimings:-")
+        for name, wall in sorted(step_times.items(), key=lambda item: item[1], reverse=True):
+            print(f"{name} -- {wall:.2f}s")
+
+    print("\nAll Done")
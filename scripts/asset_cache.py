@@ -0,0 +1,117 @@
+# asset_cache.py
+
+# Import necessary modules
+import os, time, hashlib
+from scripts.cache import cache_dir, link_tree, remove_entry, touch, evict_lru, tmp_name, cache_lock
+from scripts.state import file_digest
+from scripts.npm_cache import read_stamp as read_modules_stamp
+
+# webpack config of a project, as run by the adw alias
+WEBPACK_CONFIG = "static/webpack/webpack.config.js"
+
+# Folder of a project the sources are read from, and the default folder webpack writes to
+SOURCE_DIR = "static"
+DEFAULT_OUTPUT_DIR = "static/dist"
+
+# File inside the output folder recording which sources it was built from
+STAMP_FILE = ".build-cache-key"
+
+# Default size cap of the asset cache
+DEFAULT_MAX_MB = 1024
+
+# Folders below the sources that never feed a build
+IGNORED_DIRS = {"node_modules", ".cache", "__pycache__"}
+
+# Every source file of a build, relative to the project, without the output folder
+def source_files(project_dir, output_dir):
+    output = os.path.normpath(os.path.join(project_dir, output_dir))
+    sources = []
+    for folder, dirs, files in os.walk(os.path.join(project_dir, SOURCE_DIR)):
+        dirs[:] = sorted(name for name in dirs if name not in IGNORED_DIRS and os.path.normpath(os.path.join(folder, name)) != output)
+        sources += [os.path.join(folder, name) for name in sorted(files)]
+    return sources
+
+# Key a build by its config and sources, by path and content, and by the installed node_modules
+def assets_key(project_dir, output_dir, modules_dir):
+    digest = hashlib.sha256()
+    digest.update(f"output:{output_dir}\nmodules:{read_modules_stamp(modules_dir)}\n".encode())
+    for file_path in source_files(project_dir, output_dir):
+        digest.update(f"file:{os.path.relpath(file_path, project_dir)}={file_digest(file_path)}\n".encode())
+    return digest.hexdigest()
+
+# Read the key the output folder was last built from
+def read_stamp(output_dir):
+    try:
+        with open(os.path.join(output_dir, STAMP_FILE), "r") as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+def write_stamp(output_dir, key):
+    stamp_path = os.path.join(output_dir, STAMP_FILE)
+    with open(f"{stamp_path}.tmp", "w") as file:
+        file.write(key)
+    os.replace(f"{stamp_path}.tmp", stamp_path)
+
+# Store a hardlinked copy of the build output under its key
+def store_assets(output_dir, entry_dir):
+    if os.path.exists(entry_dir):
+        return
+    staging_dir = tmp_name(entry_dir)
+    link_tree(output_dir, staging_dir)
+    try:
+        os.rename(staging_dir, entry_dir)
+    except OSError:
+        # Another run stored the same build first
+        remove_entry(staging_dir)
+
+# Link a cached build in place when one was stored under the key
+def restore_assets(entry_dir, output_dir):
+    if not os.path.exists(os.path.join(entry_dir, STAMP_FILE)):
+        return False
+    remove_entry(output_dir)
+    link_tree(entry_dir, output_dir)
+    touch(entry_dir)
+    return True
+
+# Build the front-end assets of a project with webpack, restoring the output from the cache when possible;
+# returns the cache status and the seconds webpack ran, or None when the build failed
+def prepare_assets(run_command, project_dir, output_dir=DEFAULT_OUTPUT_DIR, modules_dir="node_modules", max_mb=DEFAULT_MAX_MB):
+    if not os.path.isfile(os.path.join(project_dir, WEBPACK_CONFIG)):
+        return 'no webpack config', 0.0
+
+    output_path = os.path.join(project_dir, output_dir)
+    cache_root = cache_dir("assets")
+    key = assets_key(project_dir, output_dir, modules_dir)
+
+    # Nothing to do when the output was built from exactly these sources
+    if read_stamp(output_path) == key:
+        return 'current', 0.0
+
+    entry_dir = os.path.join(cache_root, key)
+    with cache_lock(f"assets-{key}", shared=True):
+        if restore_assets(entry_dir, output_path):
+            return 'restored', 0.0
+
+    with cache_lock(f"assets-{key}"):
+        if restore_assets(entry_dir, output_path):
+            return 'restored', 0.0
+
+        # webpack overwrites files in place, so output linked from the cache is removed first;
+        # its own persistent cache makes the build incremental even when nothing could be restored
+        remove_entry(output_path)
+        webpack_cache = cache_dir("webpack", hashlib.sha256(os.path.abspath(project_dir).encode()).hexdigest()[:16])
+        start = time.perf_counter()
+        result = run_command(["npx", "--no-install", "webpack", "--config", WEBPACK_CONFIG, "--cache-type", "filesystem", "--cache-cache-directory", webpack_cache], cwd=project_dir)
+        duration = time.perf_counter() - start
+        if result is None:
+            return None
+
+        # A config writing somewhere else still builds, but cannot be cached
+        if not os.path.isdir(output_path):
+            print(f"warning: webpack wrote no {output_dir} -- set WEBPACK_OUTPUT_DIR to cache the build")
+            return 'built', duration
+        write_stamp(output_path, key)
+        store_assets(output_path, entry_dir)
+    evict_lru(cache_root, max_mb * 1024 * 1024, keep=[key], lock_prefix="assets")
+    return 'built', duration
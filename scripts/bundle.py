@@ -0,0 +1,233 @@
+# bundle.py
+
+# Single-file bundle of everything a provision downloads, for offline and bulk rollout.
+#
+#   MAGIC | blob | blob | ... | manifest (zlib JSON) | manifest offset, manifest size | MAGIC
+#
+# Blobs are keyed by the SHA-256 of their content, so a file that appears in
+# several caches is stored once. Each blob is zlib-compressed only when that
+# makes it noticeably smaller; package files, wheels and git packs are stored
+# as they are and extracted straight out of a memory map.
+
+# Import necessary modules
+import os, json, mmap, stat, time, zlib, struct, hashlib
+from scripts.cache import cache_dir, link_file, tmp_name
+from scripts.npm_cache import npm_cache_path, read_stamp as read_modules_stamp
+from scripts.venv_cache import venv_wheels
+from scripts.git_sync import mirror_path, project_repo
+from scripts.packages import PackageIndex, SYSTEM_PACKAGES, AUR_PACKAGES, PACMAN_CACHE, dependency_closure, cached_package_files, latest_artifacts
+
+# Marks the start and the end of a bundle
+MAGIC = b"BUILDBUNDLE1\n"
+FOOTER = struct.Struct("<QQ")
+
+# Size of the chunks blobs are hashed, compressed and extracted in
+CHUNK_SIZE = 1 << 20
+
+# Blobs that do not shrink below this ratio of their size are stored uncompressed
+COMPRESS_RATIO = 0.9
+
+# Folders bundle paths are relative to, by their first component
+def bundle_roots():
+    return {"cache": cache_dir(), "npm": npm_cache_path()}
+
+# Hash a file in chunks
+def blob_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Decide whether compressing a file is worth it from a sample of its content
+def worth_compressing(file_path):
+    with open(file_path, "rb") as file:
+        sample = file.read(1 << 16)
+    return len(sample) > 512 and len(zlib.compress(sample, 1)) < len(sample) * COMPRESS_RATIO
+
+# Every file, symlink and folder below a folder, as (bundle path, source path) pairs
+def tree_entries(prefix, root):
+    entries = []
+    if not os.path.isdir(root):
+        return entries
+    entries.append((prefix, root))
+    for folder, dirs, files in os.walk(root):
+        for name in sorted(dirs) + sorted(files):
+            path = os.path.join(folder, name)
+            entries.append((f"{prefix}/{os.path.relpath(path, root)}", path))
+    return entries
+
+# Collect what a finished provision in the current folder downloaded
+def collect_entries(env_config, venv_dir="venv", modules_dir="node_modules"):
+    entries = []
+    cache_root = cache_dir()
+
+    # System packages with their dependencies, from pacman's package cache
+    index = PackageIndex.load()
+    names = dependency_closure([name for name in SYSTEM_PACKAGES if index.has(name)])
+    package_cache = env_config.get_str("PACMAN_CACHE_DIR", PACMAN_CACHE)
+    for path in cached_package_files(index, names, package_cache):
+        entries.append((f"cache/offline/pacman/{os.path.basename(path)}", path))
+
+    # AUR builds, from the build cache or else from yay's own cache
+    for name in ["yay", *AUR_PACKAGES]:
+        packages, entry = latest_artifacts(name)
+        if not packages:
+            version = index.version(name)
+            yay_cache = os.path.join(os.path.expanduser("~"), ".cache", "yay", name)
+            packages = cached_package_files(index, [name], yay_cache) if version else []
+            entry = os.path.join(cache_dir("aur", name), "bundle")
+        for path in packages:
+            entries.append((f"cache/{os.path.relpath(os.path.join(entry, os.path.basename(path)), cache_root)}", path))
+
+    # The git mirror of the project
+    mirror = mirror_path(project_repo(env_config))
+    entries += tree_entries(f"cache/{os.path.relpath(mirror, cache_root)}", mirror)
+
+    # The wheels the venv was installed from
+    wheelhouse = cache_dir("wheels")
+    if os.path.isdir(venv_dir):
+        for path in venv_wheels(venv_dir, wheelhouse):
+            entries.append((f"cache/wheels/{os.path.basename(path)}", path))
+
+    # The cached node_modules of this dependency set, and npm's download cache
+    key = read_modules_stamp(modules_dir)
+    if key:
+        entries += tree_entries(f"cache/node_modules/{key}", os.path.join(cache_dir("node_modules"), key))
+    entries += tree_entries("npm/_cacache", os.path.join(npm_cache_path(), "_cacache"))
+    return entries
+
+# Write the entries into a bundle file; returns the manifest
+def write_bundle(bundle_path, entries, info=None):
+    manifest = {"version": 1, "created": time.time(), "info": dict(info or {}), "blobs": {}, "files": [], "links": [], "dirs": []}
+    tmp_path = tmp_name(bundle_path)
+    with open(tmp_path, "wb") as bundle:
+        bundle.write(MAGIC)
+        for bundle_path_entry, source in entries:
+            info_stat = os.lstat(source)
+            if stat.S_ISLNK(info_stat.st_mode):
+                manifest["links"].append({"path": bundle_path_entry, "target": os.readlink(source)})
+                continue
+            if stat.S_ISDIR(info_stat.st_mode):
+                manifest["dirs"].append({"path": bundle_path_entry, "mode": stat.S_IMODE(info_stat.st_mode)})
+                continue
+
+            # Content already in the bundle is only referenced again
+            digest = blob_digest(source)
+            if digest not in manifest["blobs"]:
+                manifest["blobs"][digest] = write_blob(bundle, source, info_stat.st_size)
+            manifest["files"].append({"path": bundle_path_entry, "blob": digest, "mode": stat.S_IMODE(info_stat.st_mode), "mtime": info_stat.st_mtime_ns})
+
+        data = zlib.compress(json.dumps(manifest, sort_keys=True).encode(), 6)
+        offset = bundle.tell()
+        bundle.write(data)
+        bundle.write(FOOTER.pack(offset, len(data)))
+        bundle.write(MAGIC)
+    os.replace(tmp_path, bundle_path)
+    return manifest
+
+# Append one file to the bundle, compressed when that pays off
+def write_blob(bundle, source, size):
+    offset = bundle.tell()
+    compress = worth_compressing(source)
+    compressor = zlib.compressobj(6) if compress else None
+    with open(source, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            bundle.write(compressor.compress(chunk) if compress else chunk)
+    if compress:
+        bundle.write(compressor.flush())
+    return {"offset": offset, "stored": bundle.tell() - offset, "size": size, "compression": "zlib" if compress else None}
+
+# Open a bundle and read its manifest; the caller closes the returned memory map
+def open_bundle(bundle_path):
+    with open(bundle_path, "rb") as file:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    end = len(data) - len(MAGIC)
+    if len(data) < 2 * len(MAGIC) + FOOTER.size or data[:len(MAGIC)] != MAGIC or data[end:] != MAGIC:
+        data.close()
+        raise ValueError(f"{bundle_path} is not a provisioning bundle")
+    offset, size = FOOTER.unpack_from(data, end - FOOTER.size)
+    manifest = json.loads(zlib.decompress(data[offset:offset + size]))
+    return data, manifest
+
+# Check whether a path stays inside a folder once every symlink on the way is followed
+def inside(path, root):
+    return not os.path.relpath(os.path.realpath(path), os.path.realpath(root)).startswith("..")
+
+# Map a bundle path to where it is extracted, refusing paths that leave their root,
+# also through symlinks already on disk
+def destination(bundle_path_entry, roots):
+    root_name, _, relative = bundle_path_entry.partition("/")
+    root = roots.get(root_name)
+    path = os.path.normpath(os.path.join(root, relative)) if root else None
+    if path is None or os.path.relpath(path, root).startswith("..") or not inside(path, root):
+        raise ValueError(f"unexpected path in bundle: {bundle_path_entry}")
+    return path, root
+
+# Check whether a file on disk already holds the content of a bundle entry; the mtime
+# extraction sets spares hashing files an earlier import of the same bundle wrote
+def up_to_date(path, entry, blob):
+    if not os.path.isfile(path) or os.path.islink(path) or os.path.getsize(path) != blob["size"]:
+        return False
+    return os.stat(path).st_mtime_ns == entry["mtime"] or blob_digest(path) == entry["blob"]
+
+# Write one blob out of the memory map; stored blobs are written from the map without copying
+def extract_blob(data, blob, file_path):
+    view = memoryview(data)[blob["offset"]:blob["offset"] + blob["stored"]]
+    try:
+        with open(file_path, "wb") as file:
+            if blob["compression"] == "zlib":
+                decompressor = zlib.decompressobj()
+                for start in range(0, len(view), CHUNK_SIZE):
+                    file.write(decompressor.decompress(view[start:start + CHUNK_SIZE]))
+                file.write(decompressor.flush())
+            else:
+                for start in range(0, len(view), CHUNK_SIZE):
+                    file.write(view[start:start + CHUNK_SIZE])
+    finally:
+        view.release()
+
+# Unpack a bundle into the caches; files already present with the same content are kept
+def extract_bundle(bundle_path, roots=None):
+    roots = roots or bundle_roots()
+    data, manifest = open_bundle(bundle_path)
+    written, kept, extracted = 0, 0, {}
+    try:
+        for entry in manifest["dirs"]:
+            os.makedirs(destination(entry["path"], roots)[0], exist_ok=True)
+
+        for entry in manifest["files"]:
+            path, _ = destination(entry["path"], roots)
+            blob = manifest["blobs"][entry["blob"]]
+            if up_to_date(path, entry, blob):
+                kept += 1
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            # Each blob is written once, further copies of it are linked
+            staging = tmp_name(path)
+            if entry["blob"] in extracted:
+                link_file(extracted[entry["blob"]], staging)
+            else:
+                extract_blob(data, blob, staging)
+                os.chmod(staging, entry["mode"])
+                os.utime(staging, ns=(entry["mtime"], entry["mtime"]))
+            os.replace(staging, path)
+            extracted.setdefault(entry["blob"], path)
+            written += 1
+
+        # Links may only point to somewhere inside their own root
+        for entry in manifest["links"]:
+            path, root = destination(entry["path"], roots)
+            target = entry["target"]
+            if os.path.isabs(target) or not inside(os.path.join(os.path.dirname(path), target), root):
+                raise ValueError(f"unexpected link target in bundle: {entry['path']} -> {target}")
+            if os.path.lexists(path) and (not os.path.islink(path) or os.readlink(path) == target):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            staging = tmp_name(path)
+            os.symlink(target, staging)
+            os.replace(staging, path)
+    finally:
+        data.close()
+    return manifest, written, kept
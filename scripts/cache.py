@@ -0,0 +1,161 @@
+# cache.py
+
+# Import necessary modules
+import os, shutil, hashlib, fcntl, time
+from contextlib import contextmanager
+
+# ioctl request used to clone a file's extents on filesystems that support reflinks
+FICLONE = 0x40049409
+
+# Get the folder that holds the local build caches, creating it when needed
+def cache_dir(*parts):
+    root = os.environ.get("BUILD_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "build")
+    path = os.path.join(root, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+# Whether this run provisions from an imported bundle without touching the network
+def offline_mode():
+    return os.environ.get("BUILD_OFFLINE") == "1"
+
+# Hash a list of files and extra values into a single cache key
+def hash_inputs(files=(), values=()):
+    digest = hashlib.sha256()
+    for value in values:
+        digest.update(f"value:{value}\n".encode())
+    for file_path in files:
+        digest.update(f"file:{os.path.basename(file_path)}\n".encode())
+        if os.path.isfile(file_path):
+            with open(file_path, "rb") as file:
+                for chunk in iter(lambda: file.read(1 << 20), b""):
+                    digest.update(chunk)
+        else:
+            digest.update(b"missing\n")
+    return digest.hexdigest()
+
+# Copy a single file as a hardlink, then a reflink, then a plain copy
+def link_file(src, dst):
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    try:
+        with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        shutil.copystat(src, dst)
+        return
+    except OSError:
+        pass
+    shutil.copy2(src, dst)
+
+# Materialize a copy of a folder that shares file data with the source wherever possible
+def link_tree(src, dst):
+    shutil.copytree(src, dst, symlinks=True, copy_function=link_file)
+
+# Replace the text of a file without touching other hardlinks to the same data
+def rewrite_file(file_path, old, new):
+    try:
+        with open(file_path, "rb") as file:
+            content = file.read()
+    except OSError:
+        return False
+    if old not in content:
+        return False
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(content.replace(old, new))
+    shutil.copymode(file_path, tmp_path)
+    os.replace(tmp_path, file_path)
+    return True
+
+# Remove a folder entry from the cache, tolerating a concurrent removal
+def remove_entry(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+# Mark a cache entry as just used
+def touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+# Size on disk of a file or folder, counting hardlinked data once
+def disk_usage(path, seen=None):
+    seen = set() if seen is None else seen
+    total = 0
+    if os.path.isfile(path) and not os.path.islink(path):
+        paths = [path]
+    else:
+        paths = (os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    for file_path in paths:
+        try:
+            stat = os.lstat(file_path)
+        except OSError:
+            continue
+        if (stat.st_dev, stat.st_ino) in seen:
+            continue
+        seen.add((stat.st_dev, stat.st_ino))
+        total += stat.st_blocks * 512
+    return total
+
+# Hold a file lock so that concurrent provisioning processes can share a cache entry
+@contextmanager
+def cache_lock(name, shared=False, blocking=True):
+    lock_path = os.path.join(cache_dir("locks"), f"{name}.lock")
+    with open(lock_path, "a") as lock_file:
+        flags = (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | (0 if blocking else fcntl.LOCK_NB)
+        try:
+            fcntl.flock(lock_file.fileno(), flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+# Evict the least recently used entries of a cache folder until it fits in max_bytes
+def evict_lru(directory, max_bytes, keep=(), lock_prefix=None):
+    if max_bytes is None or not os.path.isdir(directory):
+        return []
+
+    entries = []
+    for name in os.listdir(directory):
+        # Skip entries that are still being written
+        if name.startswith(".") or name.endswith(".tmp"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            last_used = os.stat(path).st_mtime
+        except OSError:
+            continue
+        entries.append((last_used, path))
+
+    total = sum(disk_usage(path) for _, path in entries)
+    evicted = []
+    for _, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path in keep or os.path.basename(path) in keep:
+            continue
+        if lock_prefix is None:
+            size = disk_usage(path)
+            remove_entry(path)
+        else:
+            # Entries another process is using are skipped rather than waited for
+            with cache_lock(f"{lock_prefix}-{os.path.basename(path)}", blocking=False) as locked:
+                if not locked:
+                    continue
+                size = disk_usage(path)
+                remove_entry(path)
+        total -= size
+        evicted.append(path)
+    return evicted
+
+# Build a unique temporary name next to a cache entry
+def tmp_name(path):
+    return f"{path}.{os.getpid()}.{time.monotonic_ns()}.tmp"
@@ -0,0 +1,67 @@
+# django_migrate.py
+
+# Run makemigrations and migrate in a single Django process.
+# Executed with the project's venv Python from inside the project folder; the
+# last line of output is a JSON report prefixed with REPORT_MARKER.
+
+# Import necessary modules
+import os, re, sys, json
+
+# Prefix of the report line
+REPORT_MARKER = "__build_migrations__"
+
+# Exit status used when the folder is not a Django project
+NOT_DJANGO = 3
+
+# Find the settings module manage.py would use
+def settings_module(manage_path):
+    try:
+        with open(manage_path, "r") as file:
+            match = re.search(r"DJANGO_SETTINGS_MODULE['\"]\s*,\s*['\"]([\w.]+)['\"]", file.read())
+    except OSError:
+        return None
+    return match.group(1) if match else None
+
+# Names of the migrations recorded as applied in the database
+def applied_migrations(connection):
+    from django.db.migrations.recorder import MigrationRecorder
+    return {f"{app}.{name}" for app, name in MigrationRecorder(connection).applied_migrations()}
+
+def main():
+    project_dir = os.getcwd()
+    module = settings_module(os.path.join(project_dir, "manage.py")) or os.environ.get("DJANGO_SETTINGS_MODULE")
+    if not module:
+        print("warning: no DJANGO_SETTINGS_MODULE found in manage.py", file=sys.stderr)
+        return NOT_DJANGO
+
+    # Boot Django once, exactly like manage.py would
+    sys.path.insert(0, project_dir)
+    os.environ["DJANGO_SETTINGS_MODULE"] = module
+    try:
+        import django
+    except ImportError:
+        print("warning: Django is not installed in this environment", file=sys.stderr)
+        return NOT_DJANGO
+    django.setup()
+
+    from django.core.management import call_command
+    from django.db import connections, DEFAULT_DB_ALIAS
+    from django.db.migrations.executor import MigrationExecutor
+
+    call_command("makemigrations", interactive=False)
+
+    # Record what migrate is about to do, then run it
+    connection = connections[DEFAULT_DB_ALIAS]
+    executor = MigrationExecutor(connection)
+    plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    planned = [f"{migration.app_label}.{migration.name}" for migration, backwards in plan if not backwards]
+    before = applied_migrations(connection)
+
+    call_command("migrate", interactive=False)
+
+    applied = sorted(applied_migrations(connection) - before)
+    print(REPORT_MARKER + json.dumps({"planned": planned, "applied": applied}))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
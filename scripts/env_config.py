@@ -0,0 +1,119 @@
+# env_config.py
+
+# Import necessary modules
+import os, threading
+
+# Parse a single value, honouring quotes and trailing comments
+def parse_value(raw):
+    raw = raw.strip()
+    if raw[:1] in ('"', "'"):
+        quote = raw[0]
+        value = []
+        index = 1
+        while index < len(raw):
+            char = raw[index]
+            if char == "\\" and quote == '"' and index + 1 < len(raw):
+                escaped = raw[index + 1]
+                value.append({"n": "\n", "t": "\t"}.get(escaped, escaped))
+                index += 2
+                continue
+            if char == quote:
+                return "".join(value)
+            value.append(char)
+            index += 1
+        # Unterminated quote, keep the text as written
+        return raw[1:]
+
+    # Unquoted values end at a comment that follows whitespace
+    comment = raw.find(" #")
+    if comment != -1:
+        raw = raw[:comment]
+    return raw.strip()
+
+# Parse the content of a .env file into a dictionary
+def parse_env(content):
+    data = {}
+    for line in content.splitlines():
+        line = line.strip()
+        # Skip blank lines and comments
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        if line.startswith("export "):
+            line = line[len("export "):]
+        key, raw = line.split("=", 1)
+        data[key.strip()] = parse_value(raw)
+    return data
+
+# Parsed view of a .env file with typed accessors
+class EnvConfig:
+    def __init__(self, path, data, signature):
+        self.path = path
+        self.data = data
+        self.signature = signature
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def get_str(self, key, default=""):
+        value = self.data.get(key)
+        return default if value is None else value
+
+    def get_int(self, key, default=0):
+        try:
+            return int(self.data[key])
+        except (KeyError, ValueError):
+            return default
+
+    def get_float(self, key, default=0.0):
+        try:
+            return float(self.data[key])
+        except (KeyError, ValueError):
+            return default
+
+    def get_bool(self, key, default=False):
+        value = self.data.get(key, "").strip().lower()
+        if value in ("1", "true", "yes", "on"):
+            return True
+        if value in ("0", "false", "no", "off"):
+            return False
+        return default
+
+    def get_list(self, key, default=(), separator=","):
+        value = self.data.get(key, "")
+        items = [item.strip() for item in value.split(separator) if item.strip()]
+        return items or list(default)
+
+# Parsed .env files shared by every step, keyed by absolute path
+_cache = {}
+_cache_lock = threading.Lock()
+
+# Identify a version of a file by its modification time and size
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+# Load a .env file, parsing it again only when it has changed on disk
+def load_env(env_path):
+    path = os.path.abspath(env_path)
+    signature = file_signature(path)
+
+    with _cache_lock:
+        config = _cache.get(path)
+        if config is not None and config.signature == signature:
+            return config
+
+        # A missing file behaves like an empty one so that every lookup falls back to its default
+        data = {}
+        if signature is not None:
+            with open(path, "r") as file:
+                data = parse_env(file.read())
+
+        config = EnvConfig(path, data, signature)
+        _cache[path] = config
+        return config
@@ -0,0 +1,79 @@
+# filesync.py
+
+# Import necessary modules
+import os, shutil, hashlib
+from scripts.state import file_digest
+from scripts.cache import tmp_name
+
+# Resolve symlinks so that a linked dotfile is updated in place instead of being replaced
+def real_path(file_path):
+    return os.path.realpath(os.path.expanduser(file_path))
+
+# Check whether a file already holds exactly the given bytes, comparing sizes before hashing
+def same_content(file_path, content):
+    try:
+        if os.stat(file_path).st_size != len(content):
+            return False
+        return file_digest(file_path) == hashlib.sha256(content).hexdigest()
+    except OSError:
+        return False
+
+# Write through a temporary file in the same folder and rename it over the target
+def replace_file(file_path, write):
+    tmp_path = tmp_name(file_path)
+    try:
+        write(tmp_path)
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+# Write text or bytes to a file only when its content differs; returns whether it was written
+def sync_content(file_path, content):
+    file_path = real_path(file_path)
+    if isinstance(content, str):
+        content = content.encode()
+    if same_content(file_path, content):
+        return False
+
+    def write(tmp_path):
+        with open(tmp_path, "wb") as file:
+            file.write(content)
+    replace_file(file_path, write)
+    return True
+
+# Copy a file only when the destination differs; returns whether it was written
+def sync_file(src_path, dest_path):
+    dest_path = real_path(dest_path)
+    src_stat = os.stat(src_path)
+    try:
+        dest_stat = os.stat(dest_path)
+    except OSError:
+        dest_stat = None
+
+    if dest_stat is not None and dest_stat.st_size == src_stat.st_size:
+        # Copies keep the source's mtime, so matching metadata means the file was synced before
+        if dest_stat.st_mtime_ns == src_stat.st_mtime_ns:
+            return False
+        if file_digest(dest_path) == file_digest(src_path):
+            return False
+
+    replace_file(dest_path, lambda tmp_path: shutil.copy2(src_path, tmp_path))
+    return True
+
+# Find the line assigning a key in an env file, exactly as written
+def existing_line(file_path, key):
+    try:
+        with open(file_path, "r") as file:
+            for line in file:
+                stripped = line.strip()
+                if stripped.startswith("export "):
+                    stripped = stripped[len("export "):].lstrip()
+                if stripped.startswith(f"{key}="):
+                    return line.rstrip("\n")
+    except OSError:
+        pass
+    return None
@@ -0,0 +1,127 @@
+# fleet.py
+
+# Provision many projects on one host. A manifest lists one project per line:
+#
+#   # <env file> [work folder]
+#   shop/provision.env
+#   /srv/blog/config.env  /srv/blog
+#
+# Relative paths are resolved against the manifest's folder, and the work
+# folder defaults to the folder holding the env file. The env file cannot be
+# the .env of its work folder, as provisioning writes that file.
+
+# Import necessary modules
+import os, sys, shlex, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Log file each project's output is written to, inside its work folder
+LOG_FILE = ".build_log.txt"
+
+# A project listed in a fleet manifest
+class FleetProject:
+    def __init__(self, env_path, work_dir):
+        self.env_path = env_path
+        self.work_dir = work_dir
+
+    def __repr__(self):
+        return f"FleetProject({self.env_path!r}, {self.work_dir!r})"
+
+# Outcome of provisioning one project, handed back from its worker process
+class ProjectResult:
+    def __init__(self, project, name=None, steps=None, messages=None, step_times=None, wall=0.0, error=None):
+        self.project = project
+        self.name = name or os.path.basename(project.work_dir)
+        self.steps = dict(steps or {})
+        self.messages = dict(messages or {})
+        self.step_times = dict(step_times or {})
+        self.wall = wall
+        self.error = error
+
+    # Categories and steps that did not complete
+    def failures(self):
+        failed = [category for category, result in self.messages.items() if result == 'failed']
+        failed += [name for name, status in self.steps.items() if status in ('failed', 'skipped')]
+        return failed
+
+    @property
+    def ok(self):
+        return self.error is None and not self.failures()
+
+# Read the projects listed in a manifest
+def read_manifest(manifest_path):
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    projects = []
+    with open(manifest_path, "r") as file:
+        for number, line in enumerate(file, 1):
+            fields = shlex.split(line, comments=True)
+            if not fields:
+                continue
+            if len(fields) > 2:
+                raise ValueError(f"{manifest_path}:{number}: expected '<env file> [work folder]'")
+            env_path = os.path.normpath(os.path.join(base, os.path.expanduser(fields[0])))
+            work_dir = os.path.normpath(os.path.join(base, os.path.expanduser(fields[1]))) if len(fields) > 1 else os.path.dirname(env_path)
+            if env_path == os.path.join(work_dir, ".env"):
+                raise ValueError(f"{manifest_path}:{number}: {env_path} would be overwritten by the .env written to {work_dir} -- rename it or give another work folder")
+            projects.append(FleetProject(env_path, work_dir))
+
+    # Two projects in one work folder would overwrite each other's venv and state
+    seen = {}
+    for project in projects:
+        if project.work_dir in seen:
+            raise ValueError(f"{project.env_path} and {seen[project.work_dir]} share the work folder {project.work_dir}")
+        seen[project.work_dir] = project.env_path
+    return projects
+
+# Default number of projects provisioned at the same time
+def default_workers():
+    return min(4, os.cpu_count() or 1)
+
+# Send this process's output, including that of its subprocesses, to a log file
+def redirect_output(log_path):
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = (os.dup(1), os.dup(2))
+    with open(log_path, "a") as log_file:
+        os.dup2(log_file.fileno(), 1)
+        os.dup2(log_file.fileno(), 2)
+    return saved
+
+# Undo redirect_output
+def restore_output(saved):
+    sys.stdout.flush()
+    sys.stderr.flush()
+    for fd, copy in zip((1, 2), saved):
+        os.dup2(copy, fd)
+        os.close(copy)
+
+# Provision every project on a pool of worker processes, each running worker(project, jobs)
+def run_fleet(projects, worker, workers=None, jobs=None):
+    results = {}
+    # Forked workers inherit the imported modules, so nothing is imported again per project
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(max_workers=max(1, workers or default_workers()), mp_context=context) as pool:
+        futures = {pool.submit(worker, project, jobs): index for index, project in enumerate(projects)}
+        for future in as_completed(futures):
+            index = futures[future]
+            project = projects[index]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = ProjectResult(project, error=str(e))
+            results[index] = result
+
+            if result.ok:
+                print(f"success: {result.name} provisioned in {result.wall:.2f}s -- {project.work_dir}")
+            else:
+                reason = result.error or ", ".join(result.failures())
+                print(f"Error: {result.name} failed -- {reason} -- see {os.path.join(project.work_dir, LOG_FILE)}")
+
+    # Report in manifest order, whatever order the projects finished in
+    return [results[index] for index in range(len(projects))]
+
+# Print one line per project
+def fleet_summary(results):
+    print("\nProjects:-")
+    for result in results:
+        state = 'success' if result.ok else 'failed'
+        print(f"{result.name} -- {state} in {result.wall:.2f}s ({result.project.work_dir})")
@@ -0,0 +1,109 @@
+# git_sync.py
+
+# Import necessary modules
+import os, re, hashlib
+from scripts.cache import cache_dir, remove_entry, tmp_name, cache_lock, offline_mode
+from scripts.trace import run_process
+
+# Longest a single git command may take before it is considered hung
+GIT_TIMEOUT = 1800
+
+# Run a git command and report whether it succeeded
+def git(*args, cwd=None):
+    return run_process(["git", *args], cwd=cwd, timeout=GIT_TIMEOUT).returncode == 0
+
+# URL a project is cloned from, by default its repository on GitHub
+def project_repo(config):
+    prj_name = config.get("PROJECT_NAME", "myProject")
+    return config.get_str("PROJECT_REPO", f"https://github.com/adityathute/{prj_name}.git")
+
+# Bare mirror of a repository under the cache folder, one per URL
+def mirror_path(url):
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", url.rstrip("/").rsplit("/", 1)[-1].removesuffix(".git")) or "repo"
+    return os.path.join(cache_dir("git"), f"{name}-{hashlib.sha1(url.encode()).hexdigest()[:12]}.git")
+
+# Create the mirror, or fetch only what changed since the last provision
+def update_mirror(url, mirror=None):
+    mirror = mirror or mirror_path(url)
+    if offline_mode():
+        # Offline the mirror imported from a bundle is used as it is
+        if not os.path.isdir(mirror):
+            print(f"Error: no mirror of {url} in the cache -- import a bundle that contains it")
+            return None
+        return mirror
+    if os.path.isdir(mirror):
+        if not git("--git-dir", mirror, "remote", "update", "--prune"):
+            # A stale mirror is still better than nothing when the remote cannot be reached
+            print(f"warning: could not update the mirror of {url} -- using the cached copy")
+        return mirror
+
+    staging = tmp_name(mirror)
+    if not git("clone", "--mirror", "--quiet", url, staging):
+        remove_entry(staging)
+        return None
+
+    # Allow shallow and partial clones to be served from the mirror
+    git("--git-dir", staging, "config", "uploadpack.allowFilter", "true")
+    git("--git-dir", staging, "config", "uploadpack.allowAnySHA1InWant", "true")
+    try:
+        os.rename(staging, mirror)
+    except OSError:
+        # Another run created the same mirror first
+        remove_entry(staging)
+    return mirror
+
+# Options that make a clone or fetch shallow and/or partial
+def transfer_options(depth=0, blob_filter=None):
+    options = []
+    if depth:
+        options.append(f"--depth={depth}")
+    if blob_filter:
+        options.append(f"--filter={blob_filter}")
+    return options
+
+# Create a working copy from the mirror and point its origin back at the real remote
+def clone_checkout(url, destination, branch, mirror, depth=0, blob_filter=None):
+    options = transfer_options(depth, blob_filter)
+    if options:
+        # Shallow and partial transfers need the file:// transport, even for a local mirror
+        source = f"file://{os.path.abspath(mirror)}"
+    else:
+        # A plain local clone hardlinks the mirror's objects instead of copying them
+        source = mirror
+    if not git("clone", "--quiet", "--branch", branch, *options, source, destination):
+        return False
+    return git("-C", destination, "remote", "set-url", "origin", url)
+
+# Fast-forward an existing working copy with the new commits from the mirror
+def update_checkout(destination, branch, mirror, blob_filter=None):
+    # A shallow checkout fetches back to its shallow boundary without --depth, so history stays connected
+    options = transfer_options(0, blob_filter)
+    source = f"file://{os.path.abspath(mirror)}" if options and os.path.isdir(mirror) else mirror
+    if not git("-C", destination, "fetch", "--quiet", *options, source, branch):
+        return 'failed'
+    before = run_process(["git", "-C", destination, "rev-parse", "HEAD"], capture=True, timeout=60).stdout.strip()
+    # A checkout with commits of its own is left as is
+    if not git("-C", destination, "merge", "--ff-only", "--quiet", "FETCH_HEAD"):
+        return 'diverged'
+    after = run_process(["git", "-C", destination, "rev-parse", "HEAD"], capture=True, timeout=60).stdout.strip()
+    return 'current' if before == after else 'updated'
+
+# Clone or update a working copy through the local mirror cache
+def sync_repository(url, destination, branch, depth=0, blob_filter=None, use_mirror=True):
+    if not use_mirror and not offline_mode():
+        # Talk to the remote directly
+        if os.path.exists(destination):
+            return update_checkout(destination, branch, url, blob_filter)
+        return 'cloned' if git("clone", "--quiet", "--branch", branch, *transfer_options(depth, blob_filter), url, destination) else 'failed'
+
+    # One process updates a mirror at a time, while any number may read from it
+    mirror = mirror_path(url)
+    lock_name = f"git-{os.path.basename(mirror)}"
+    with cache_lock(lock_name):
+        mirror = update_mirror(url, mirror)
+    if mirror is None:
+        return 'failed'
+    with cache_lock(lock_name, shared=True):
+        if os.path.exists(destination):
+            return update_checkout(destination, branch, mirror, blob_filter)
+        return 'cloned' if clone_checkout(url, destination, branch, mirror, depth, blob_filter) else 'failed'
@@ -0,0 +1,185 @@
+# mariadb.py
+
+# Import necessary modules
+import os, re, socket, subprocess, time
+from scripts.trace import run_process
+
+# Client used to talk to the local server as root over the Unix socket
+MARIADB_CLIENT = ("sudo", "mariadb")
+
+# Default server layout on Arch Linux
+DATADIR = "/var/lib/mysql"
+SOCKET_PATH = "/run/mysqld/mysqld.sock"
+SERVICE = "mariadb.service"
+
+# Prefix of the marker rows that separate the output of each statement
+MARKER = "__build_statement__"
+
+# Error lines printed by the client in batch mode
+ERROR_PATTERN = re.compile(r"^ERROR (\d+)(?: \(\w+\))? at line (\d+)(?: in file: '[^']*')?: (.*)$")
+
+# Quote a value as an SQL string literal
+def sql_string(value):
+    escaped = str(value).replace("\\", "\\\\").replace("'", "\\'").replace("\n", "\\n").replace("\r", "\\r").replace("\0", "\\0")
+    return f"'{escaped}'"
+
+# Quote a database, table or column name
+def sql_identifier(name):
+    return "`" + str(name).replace("`", "``") + "`"
+
+# Outcome of a single statement in a batch
+class StatementResult:
+    def __init__(self, statement, ok=True, rows=None, error=None):
+        self.statement = statement
+        self.ok = ok
+        self.rows = rows if rows is not None else []
+        self.error = error
+
+    # First column of the first row, for single value queries
+    def scalar(self, default=None):
+        return self.rows[0][0] if self.rows and self.rows[0] else default
+
+    def __repr__(self):
+        return f"StatementResult(ok={self.ok!r}, rows={self.rows!r}, error={self.error!r})"
+
+# Run every statement in a single client session and return one result per statement
+def run_batch(statements, client=MARIADB_CLIENT, timeout=None):
+    statements = list(statements)
+
+    # Each statement sits on its own line after a marker row, so output and errors map back to it
+    lines = []
+    for index, statement in enumerate(statements):
+        lines.append(f"SELECT '{MARKER}{index}';")
+        lines.append(" ".join(statement.strip().rstrip(";").splitlines()) + ";")
+    script = "\n".join(lines) + "\n"
+
+    try:
+        process = run_process([*client, "--batch", "--skip-column-names", "--force"], input=script, capture=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return [StatementResult(statement, ok=False, error=str(e)) for statement in statements]
+
+    results = [StatementResult(statement) for statement in statements]
+    seen = set()
+
+    # Collect the rows printed after each marker
+    current = None
+    for line in process.stdout.splitlines():
+        if line.startswith(MARKER):
+            current = int(line[len(MARKER):])
+            seen.add(current)
+            continue
+        if current is not None:
+            results[current].rows.append(line.split("\t"))
+
+    # Attach each error to the statement on the reported line
+    for line in process.stderr.splitlines():
+        match = ERROR_PATTERN.match(line.strip())
+        if match:
+            index = (int(match.group(2)) - 2) // 2
+            if 0 <= index < len(results):
+                results[index].ok = False
+                results[index].error = f"ERROR {match.group(1)}: {match.group(3)}"
+
+    # Statements that never ran, e.g. when the client could not connect, failed as a whole
+    failure = process.stderr.strip() or f"mariadb exited with status {process.returncode}"
+    for index, result in enumerate(results):
+        if index not in seen and result.ok:
+            result.ok = False
+            result.error = failure
+
+    return results
+
+# Build the statements that provision databases, an application user and the root password
+def provisioning_statements(databases, root_password=None, user=None, user_password=None, host="localhost"):
+    statements = []
+    for database in databases:
+        statements.append(f"SELECT COUNT(*) FROM information_schema.SCHEMATA WHERE SCHEMA_NAME = {sql_string(database)}")
+        statements.append(f"CREATE DATABASE IF NOT EXISTS {sql_identifier(database)}")
+
+    if user and user != "root":
+        account = f"{sql_string(user)}@{sql_string(host)}"
+        statements.append(f"CREATE USER IF NOT EXISTS {account} IDENTIFIED BY {sql_string(user_password or '')}")
+        for database in databases:
+            statements.append(f"GRANT ALL PRIVILEGES ON {sql_identifier(database)}.* TO {account}")
+
+    if root_password is not None:
+        statements.append(f"SET PASSWORD FOR 'root'@'localhost' = PASSWORD({sql_string(root_password)})")
+
+    return statements
+
+# Check whether the datadir already holds the system tables
+def datadir_initialized(datadir=DATADIR, sudo=("sudo",)):
+    system_tables = os.path.join(datadir, "mysql")
+    if os.access(datadir, os.R_OK | os.X_OK):
+        return os.path.isdir(system_tables)
+    # The datadir is usually readable by the mysql user only
+    return run_process([*sudo, "test", "-d", system_tables], timeout=60).returncode == 0
+
+# Check whether the server accepts connections on its Unix socket
+def socket_ready(socket_path=SOCKET_PATH):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(1.0)
+        try:
+            client.connect(socket_path)
+            return True
+        except OSError:
+            return False
+
+# Wait for the socket with bounded exponential backoff, returning the seconds waited or None on timeout
+def wait_for_socket(socket_path=SOCKET_PATH, timeout=30.0, initial_delay=0.05, max_delay=1.0):
+    start = time.monotonic()
+    delay = initial_delay
+    while True:
+        if socket_ready(socket_path):
+            return time.monotonic() - start
+        remaining = timeout - (time.monotonic() - start)
+        if remaining <= 0:
+            return None
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+# Describe a failed command by its exit status and the last lines of its error output
+def command_error(name, result, lines=5):
+    output = (result.stderr or result.stdout or "").strip().splitlines()[-lines:]
+    return f"{name} exited with status {result.returncode}" + (": " + " ".join(line.strip() for line in output) if output else "")
+
+# Outcome of bringing the server up
+class BringUp:
+    def __init__(self, initialized=False, started=False, ready=False, waited=0.0, error=None):
+        self.initialized = initialized
+        self.started = started
+        self.ready = ready
+        self.waited = waited
+        # Why the server could not be brought up, when a command failed
+        self.error = error
+
+    def __repr__(self):
+        return f"BringUp(initialized={self.initialized!r}, started={self.started!r}, ready={self.ready!r}, waited={self.waited:.2f})"
+
+# Initialize the datadir when needed, start and enable the service, and wait until it accepts connections
+def bring_up(datadir=DATADIR, socket_path=SOCKET_PATH, service=SERVICE, timeout=30.0, sudo=("sudo",), systemctl=("systemctl",)):
+    result = BringUp()
+
+    # A server that already answers needs neither install-db nor systemctl
+    if socket_ready(socket_path):
+        result.ready = True
+        return result
+
+    if not datadir_initialized(datadir, sudo):
+        install = run_process([*sudo, "mariadb-install-db", "--user=mysql", "--basedir=/usr", f"--datadir={datadir}"], capture=True, timeout=600)
+        if install.returncode != 0:
+            result.error = command_error("mariadb-install-db", install)
+            return result
+        result.initialized = True
+
+    # Start and enable in a single systemctl call; a failed start is reported instead of waited for
+    start = run_process([*sudo, *systemctl, "enable", "--now", service], capture=True, timeout=300)
+    if start.returncode != 0:
+        result.error = command_error(f"systemctl enable --now {service}", start)
+        return result
+    result.started = True
+
+    waited = wait_for_socket(socket_path, timeout)
+    result.ready = waited is not None
+    result.waited = timeout if waited is None else waited
+    return result
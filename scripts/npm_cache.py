@@ -0,0 +1,110 @@
+# npm_cache.py
+
+# Import necessary modules
+import os
+from scripts.cache import cache_dir, hash_inputs, link_tree, remove_entry, touch, evict_lru, tmp_name, cache_lock, offline_mode
+
+# File inside node_modules recording which package.json and lockfile it was installed from
+STAMP_FILE = ".build-cache-key"
+
+# Default size cap of the node_modules cache
+DEFAULT_MAX_MB = 4096
+
+# Folder of npm's own download cache
+def npm_cache_path():
+    return os.environ.get("npm_config_cache") or os.path.join(os.path.expanduser("~"), ".npm")
+
+# Key the dependency set by the content of package.json, and of the lockfile when it is kept;
+# otherwise the lockfile is removed and written again by npm, so it cannot be part of the key
+def dependencies_key(project_dir=".", keep_lockfile=False):
+    files = [os.path.join(project_dir, "package.json")]
+    if keep_lockfile:
+        files.append(os.path.join(project_dir, "package-lock.json"))
+    return hash_inputs(files, ["lockfile" if keep_lockfile else "resolved"])
+
+# Read the key node_modules was last installed from
+def read_stamp(modules_dir):
+    try:
+        with open(os.path.join(modules_dir, STAMP_FILE), "r") as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+# Record the key node_modules was installed from without touching data shared with the cache
+def write_stamp(modules_dir, key):
+    stamp_path = os.path.join(modules_dir, STAMP_FILE)
+    with open(f"{stamp_path}.tmp", "w") as file:
+        file.write(key)
+    os.replace(f"{stamp_path}.tmp", stamp_path)
+
+# Store a hardlinked copy of node_modules under its key
+def store_modules(modules_dir, entry_dir):
+    if os.path.exists(entry_dir):
+        return
+    staging_dir = tmp_name(entry_dir)
+    link_tree(modules_dir, staging_dir)
+    try:
+        os.rename(staging_dir, entry_dir)
+    except OSError:
+        # Another run stored the same dependency set first
+        remove_entry(staging_dir)
+
+# Link a cached dependency set in place when one was stored under the key, stamped with the key it was found under
+def restore_modules(entry_dir, modules_dir, key):
+    if not os.path.exists(os.path.join(entry_dir, STAMP_FILE)):
+        return False
+    remove_entry(modules_dir)
+    link_tree(entry_dir, modules_dir)
+    write_stamp(modules_dir, key)
+    touch(entry_dir)
+    return True
+
+# Install node_modules for the package.json in project_dir, restoring it from the cache when possible
+def prepare_node_modules(run_command, project_dir=".", keep_lockfile=False, max_mb=DEFAULT_MAX_MB):
+    modules_dir = os.path.join(project_dir, "node_modules")
+    lockfile = os.path.join(project_dir, "package-lock.json")
+    cache_root = cache_dir("node_modules")
+    key = dependencies_key(project_dir, keep_lockfile)
+
+    # Nothing to do when node_modules already matches package.json and the lockfile
+    if read_stamp(modules_dir) == key:
+        return 'current'
+
+    # A dependency set seen before on this machine is linked in place
+    entry_dir = os.path.join(cache_root, key)
+    with cache_lock(f"node_modules-{key}", shared=True):
+        if restore_modules(entry_dir, modules_dir, key):
+            return 'restored'
+
+    # Only one process installs a given dependency set; the others wait and link its result
+    with cache_lock(f"node_modules-{key}"):
+        if restore_modules(entry_dir, modules_dir, key):
+            return 'restored'
+
+        # npm rewrites files inside node_modules in place, so a node_modules linked from a cache entry
+        # is removed first; npm's own download cache still spares the network
+        if read_stamp(modules_dir) is not None:
+            remove_entry(modules_dir)
+
+        # Install deterministically from the lockfile, falling back to a resolve when it is out of date
+        # Offline, packages come from npm's cache as imported from a bundle
+        options = ["--no-audit", "--no-fund", *(["--offline"] if offline_mode() else [])]
+        result = None
+        if keep_lockfile and os.path.exists(lockfile):
+            result = run_command(["npm", "ci", *options], cwd=project_dir)
+        if result is None:
+            result = run_command(["npm", "install", *options], cwd=project_dir)
+            if result is None:
+                return None
+
+        # A kept lockfile npm has just written changes the key of the next run, so the result
+        # is stored under the key it was looked up with and under the one it will be looked up with
+        installed_key = dependencies_key(project_dir, keep_lockfile)
+        os.makedirs(modules_dir, exist_ok=True)
+        write_stamp(modules_dir, installed_key)
+        store_modules(modules_dir, entry_dir)
+        if installed_key != key:
+            with cache_lock(f"node_modules-{installed_key}"):
+                store_modules(modules_dir, os.path.join(cache_root, installed_key))
+    evict_lru(cache_root, max_mb * 1024 * 1024, keep=[key, installed_key], lock_prefix="node_modules")
+    return 'installed'
@@ -0,0 +1,196 @@
+# packages.py
+
+# Import necessary modules
+import os, re, glob, tempfile, subprocess
+from scripts.cache import cache_dir, remove_entry, touch, tmp_name, cache_lock, offline_mode
+from scripts.trace import run_process
+
+# Packages installed from the official repositories
+SYSTEM_PACKAGES = ["firefox", "nodejs", "npm", "base-devel", "mariadb"]
+
+# Packages installed from the AUR once yay is available
+AUR_PACKAGES = ["visual-studio-code-bin"]
+
+# Base URL of AUR package repositories
+AUR_URL = "https://aur.archlinux.org"
+
+# Longest a package download, build or install may take before it is considered hung
+INSTALL_TIMEOUT = 3600
+
+# Folder pacman keeps downloaded package files in
+PACMAN_CACHE = "/var/cache/pacman/pkg"
+
+# Folder package files imported from a bundle are installed from when offline
+def offline_packages_dir():
+    return cache_dir("offline", "pacman")
+
+# Name of the package a package file holds, e.g. nodejs-21.5.0-1-x86_64.pkg.tar.zst -> nodejs
+def package_file_name(file_path):
+    return os.path.basename(file_path).split(".pkg.tar")[0].rsplit("-", 3)[0]
+
+# Installed packages and versions, read with a single query
+class PackageIndex:
+    def __init__(self, installed=None):
+        self.installed = dict(installed or {})
+
+    # Read every installed package with one 'pacman -Q'
+    @classmethod
+    def load(cls, pkg_manager="pacman"):
+        # Every line is needed, so the capture is not bounded
+        result = run_process([pkg_manager, "-Q"], capture=True, lines=None, timeout=120)
+        installed = {}
+        for line in result.stdout.splitlines():
+            parts = line.split()
+            if len(parts) >= 2:
+                installed[parts[0]] = parts[1]
+        return cls(installed)
+
+    def has(self, name):
+        return name in self.installed
+
+    def version(self, name):
+        return self.installed.get(name)
+
+    # Packages of a list that are not installed yet
+    def missing(self, packages):
+        return [name for name in packages if name not in self.installed]
+
+    # Record packages installed after the index was read
+    def add(self, names, version="unknown"):
+        for name in names:
+            self.installed.setdefault(name, version)
+
+# Install only the missing packages, all in one transaction
+def install_missing(index, packages, pkg_manager="pacman"):
+    missing = index.missing(packages)
+    if not missing:
+        return []
+    if offline_mode():
+        # Install the bundled files of every package that is not installed yet, dependencies included
+        files = [path for path in sorted(glob.glob(os.path.join(offline_packages_dir(), "*.pkg.tar*")))
+                 if not path.endswith(".sig") and not index.has(package_file_name(path))]
+        bundled = {package_file_name(path) for path in files}
+        absent = [name for name in missing if name not in bundled]
+        if absent:
+            print(f"Error: not in the bundle -- {' '.join(absent)}")
+            return None
+        result = run_process(["sudo", pkg_manager, "-U", "--needed", "--noconfirm", *files], timeout=INSTALL_TIMEOUT)
+    else:
+        result = run_process(["sudo", pkg_manager, "-Sq", "--needed", "--noconfirm", *missing], timeout=INSTALL_TIMEOUT)
+    if result.returncode != 0:
+        return None
+    index.add(missing)
+    return missing
+
+# Strip the version constraint of a dependency, e.g. glibc>=2.38 -> glibc
+def dependency_name(dependency):
+    return re.split(r"[<>=]", dependency, 1)[0]
+
+# Installed packages the given ones depend on, directly or not, read with a single 'pacman -Qi'
+def dependency_closure(names, pkg_manager="pacman"):
+    result = run_process([pkg_manager, "-Qi"], capture=True, lines=None, timeout=120, env=dict(os.environ, LC_ALL="C"))
+    depends, provides = {}, {}
+    for block in (result.stdout or "").split("\n\n"):
+        fields, key = {}, None
+        for line in block.splitlines():
+            if " : " in line and not line.startswith(" "):
+                key, value = line.split(" : ", 1)
+                key = key.strip()
+                fields[key] = value.strip()
+            elif key:
+                # Long lists continue on indented lines
+                fields[key] += " " + line.strip()
+        name = fields.get("Name")
+        if not name:
+            continue
+        depends[name] = [dependency_name(dep) for dep in fields.get("Depends On", "None").split() if dep != "None"]
+        for provided in fields.get("Provides", "None").split():
+            if provided != "None":
+                provides.setdefault(dependency_name(provided), name)
+
+    closure, queue = set(), list(names)
+    while queue:
+        name = queue.pop()
+        name = name if name in depends else provides.get(name, name)
+        if name not in closure:
+            closure.add(name)
+            queue.extend(depends.get(name, []))
+    return sorted(closure)
+
+# Package files in pacman's cache for the installed version of each package
+def cached_package_files(index, names, package_cache=PACMAN_CACHE):
+    files = []
+    for name in names:
+        version = index.version(name)
+        if not version:
+            continue
+        for path in glob.glob(os.path.join(package_cache, f"{glob.escape(name)}-{glob.escape(version)}-*.pkg.tar*")):
+            if not path.endswith(".sig") and package_file_name(path) == name:
+                files.append(path)
+    return sorted(files)
+
+# Current revision of an AUR package's PKGBUILD repository, without cloning it
+def aur_revision(name):
+    try:
+        result = run_process(["git", "ls-remote", f"{AUR_URL}/{name}.git", "HEAD"], capture=True, timeout=30)
+    except subprocess.TimeoutExpired:
+        return None
+    fields = result.stdout.split()
+    return fields[0] if result.returncode == 0 and fields else None
+
+# Built package files kept for a PKGBUILD revision
+def cached_artifacts(name, revision):
+    entry = os.path.join(cache_dir("aur", name), revision)
+    return sorted(glob.glob(os.path.join(entry, "*.pkg.tar*"))), entry
+
+# Most recently used cached build of a package, used when the AUR cannot be reached
+def latest_artifacts(name):
+    root = cache_dir("aur", name)
+    entries = [os.path.join(root, entry) for entry in os.listdir(root) if not entry.endswith(".tmp")]
+    for entry in sorted(entries, key=os.path.getmtime, reverse=True):
+        packages = sorted(glob.glob(os.path.join(entry, "*.pkg.tar*")))
+        if packages:
+            return packages, entry
+    return [], None
+
+# Build an AUR package into the cache entry for its revision
+def build_aur_package(name, entry):
+    with tempfile.TemporaryDirectory(prefix=f"aur-{name}-") as work_dir:
+        source_dir = os.path.join(work_dir, name)
+        if run_process(["git", "clone", "--depth", "1", f"{AUR_URL}/{name}.git", source_dir], timeout=600).returncode != 0:
+            return []
+
+        # Build only; the packages are installed from the cache afterwards
+        staging_dir = tmp_name(entry)
+        os.makedirs(staging_dir)
+        env = dict(os.environ, PKGDEST=staging_dir)
+        if run_process(["makepkg", "-s", "--noconfirm", "--needed"], cwd=source_dir, env=env, timeout=INSTALL_TIMEOUT).returncode != 0:
+            remove_entry(staging_dir)
+            return []
+
+        remove_entry(entry)
+        os.rename(staging_dir, entry)
+    return sorted(glob.glob(os.path.join(entry, "*.pkg.tar*")))
+
+# Install an AUR package from the build cache, compiling it only for a PKGBUILD revision not seen before
+def install_aur_package(name):
+    # Offline, the most recent build in the cache (or the bundle) is used as is
+    revision = None if offline_mode() else aur_revision(name)
+    # Concurrent provisions build a given package one at a time
+    with cache_lock(f"aur-{name}"):
+        if revision:
+            packages, entry = cached_artifacts(name, revision)
+            status = 'cached' if packages else 'built'
+            if not packages:
+                packages = build_aur_package(name, entry)
+        else:
+            packages, entry = latest_artifacts(name)
+            status = 'cached'
+
+    if not packages:
+        return None
+
+    touch(entry)
+    if run_process(["sudo", "pacman", "-U", "--needed", "--noconfirm", *packages], timeout=INSTALL_TIMEOUT).returncode != 0:
+        return None
+    return status
@@ -0,0 +1,147 @@
+# preflight.py
+
+# Probe the host once, before any step runs, and keep the answers in one read-only snapshot.
+# Steps trust what the snapshot found; what it did not find is checked again where it is
+# used, as an earlier step of the same run may have installed or created it since.
+
+# Import necessary modules
+import os, time, shutil, platform
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+from scripts.trace import run_process, tracer
+from scripts.packages import PackageIndex
+from scripts.mariadb import SERVICE
+from scripts.cache import cache_dir
+
+# Commands the steps look up
+COMMANDS = ["yay", "mariadb", "npm", "node", "gh", "git", "systemctl"]
+
+# Longest a single probe may take
+PROBE_TIMEOUT = 60
+
+# State of the host and the provisioning folder before the run
+class Snapshot:
+    def __init__(self, commands, packages, service, github, paths, versions, disk):
+        values = {
+            "commands": MappingProxyType(dict(commands)),
+            # None when the package list could not be read
+            "packages": None if packages is None else MappingProxyType(dict(packages)),
+            "service": service,
+            # True or False once checked, None when no GitHub remote needs the login
+            "github": github,
+            "paths": MappingProxyType(dict(paths)),
+            "versions": MappingProxyType(dict(versions)),
+            "disk": MappingProxyType(dict(disk)),
+            "taken": time.time(),
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("a preflight snapshot is read-only")
+
+    def command(self, name):
+        return self.commands.get(name)
+
+    def exists(self, path):
+        return self.paths.get(path)
+
+    # Packages of a list the snapshot did not find installed
+    def missing(self, packages):
+        installed = self.packages or {}
+        return [name for name in packages if name not in installed and not self.commands.get(name)]
+
+    def __repr__(self):
+        return f"Snapshot(packages={len(self.packages or {})}, service={self.service!r}, github={self.github!r})"
+
+# Run one probe, turning a failure into an unknown answer
+def probe(func, *args):
+    try:
+        return func(*args)
+    except Exception:
+        return None
+
+def installed_packages(pkg_manager):
+    return PackageIndex.load(pkg_manager).installed
+
+def service_state(service):
+    result = run_process(["systemctl", "is-active", service], capture=True, timeout=PROBE_TIMEOUT)
+    return result.stdout.strip() or None
+
+def github_login():
+    return run_process(["gh", "auth", "status"], capture=True, timeout=PROBE_TIMEOUT).returncode == 0
+
+def command_version(command):
+    result = run_process([command, "--version"], capture=True, timeout=PROBE_TIMEOUT)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+# Free bytes on the filesystem of a folder
+def free_space(path):
+    return shutil.disk_usage(path).free
+
+# Gather every probe concurrently; commands that are not installed are not probed
+def take_snapshot(paths=(), github=False, pkg_manager="pacman"):
+    with tracer.span("preflight", "step"):
+        commands = {name: shutil.which(name) for name in COMMANDS + [pkg_manager]}
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            packages = pool.submit(probe, installed_packages, pkg_manager) if commands[pkg_manager] else None
+            service = pool.submit(probe, service_state, SERVICE) if commands["systemctl"] else None
+            login = pool.submit(probe, github_login) if github and commands["gh"] else None
+            node = pool.submit(probe, command_version, "node") if commands["node"] else None
+
+            exists = {path: os.path.exists(path) for path in paths}
+            disk = {"work": probe(free_space, "."), "cache": probe(free_space, cache_dir())}
+            versions = {"python": platform.python_version(), "node": node.result() if node else None}
+
+            return Snapshot(
+                commands,
+                packages.result() if packages else None,
+                service.result() if service else None,
+                (login.result() or False) if login else None,
+                exists, versions, disk,
+            )
+
+# Snapshot of the current run, consulted by the steps; None probes everything at the point of use
+snapshot = None
+
+def set_snapshot(value):
+    global snapshot
+    snapshot = value
+
+# Path of a command, taken from the snapshot when it was found there
+def find_command(name):
+    if snapshot is not None and snapshot.command(name):
+        return snapshot.command(name)
+    return shutil.which(name)
+
+# Installed packages, from the snapshot when it could read them
+def package_index(pkg_manager="pacman"):
+    if snapshot is not None and snapshot.packages is not None:
+        return PackageIndex(snapshot.packages)
+    return PackageIndex.load(pkg_manager)
+
+# Whether the snapshot already found a GitHub login
+def github_logged_in():
+    return snapshot is not None and snapshot.github is True
+
+# Format a number of bytes for the plan
+def format_size(size):
+    return "unknown" if size is None else f"{size / (1024 ** 3):.1f} GB"
+
+# Print the host state and what every step is going to do
+def print_plan(host, steps, state, notes):
+    print("\nHost:-")
+    print(f"python -- {host.versions['python']}")
+    print(f"node -- {host.versions['node'] or 'not installed'}")
+    print(f"free disk -- {format_size(host.disk['work'])} here, {format_size(host.disk['cache'])} for the cache")
+    print(f"mariadb service -- {host.service or 'unknown'}")
+    print(f"github login -- {'not needed' if host.github is None else 'yes' if host.github else 'required'}")
+    missing = [name for name, path in host.commands.items() if not path]
+    print(f"commands -- {'all found' if not missing else 'missing ' + ', '.join(missing)}")
+
+    print("\nPlan:-")
+    for step in steps:
+        if state is not None and step.cache is not None and state.is_fresh(step.name, step.cache):
+            print(f"{step.name} -- inputs unchanged, cached")
+        else:
+            print(f"{step.name} -- {notes.get(step.name, 'run')}")
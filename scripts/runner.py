@@ -0,0 +1,251 @@
+# runner.py
+
+# Import necessary modules
+import os, sys, shlex, asyncio, itertools, threading, subprocess
+from collections import deque
+from contextlib import nullcontext
+
+# Output lines kept in memory for a captured command; older lines are dropped
+CAPTURE_LINES = 2000
+
+# Seconds a command gets to exit after SIGTERM before it is killed
+KILL_GRACE = 5.0
+
+# Seconds output is still read after a command exited, for pipes a leftover daemon holds open
+PIPE_GRACE = 1.0
+
+# Size of the chunks output is read in, and the longest line kept whole
+CHUNK_SIZE = 1 << 16
+MAX_LINE = 1 << 20
+
+# Log of every command and its full output, written to the provisioning root
+LOG_FILE = ".build_commands.log"
+
+# Raised for a command that was cancelled before or while it ran
+class CommandCancelled(Exception):
+    pass
+
+# Outcome of a command, shaped like subprocess.CompletedProcess
+class CommandResult:
+    def __init__(self, args, returncode, stdout=None, stderr=None, output_bytes=None, dropped_lines=0):
+        self.args = args
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.output_bytes = output_bytes
+        self.dropped_lines = dropped_lines
+
+    def check_returncode(self):
+        if self.returncode != 0:
+            raise subprocess.CalledProcessError(self.returncode, self.args, self.stdout, self.stderr)
+
+    def __repr__(self):
+        return f"CommandResult(args={self.args!r}, returncode={self.returncode!r})"
+
+# The tail of one output stream, at most `lines` lines long
+class Capture:
+    def __init__(self, lines=CAPTURE_LINES):
+        self.lines = deque(maxlen=lines)
+        self.count = 0
+
+    def append(self, line):
+        self.lines.append(line)
+        self.count += 1
+
+    @property
+    def dropped(self):
+        return self.count - len(self.lines)
+
+    def text(self):
+        return "".join(self.lines)
+
+# Stream protocol that reports the exit of the process itself, without waiting for its pipes to close
+class ExitProtocol(asyncio.subprocess.SubprocessStreamProtocol):
+    def __init__(self, limit, loop):
+        super().__init__(limit=limit, loop=loop)
+        self.exited = loop.create_future()
+
+    def process_exited(self):
+        returncode = self._transport.get_returncode()
+        super().process_exited()
+        if not self.exited.done():
+            self.exited.set_result(returncode)
+
+# Runs commands from argv lists on an asyncio loop, streaming their output as it arrives
+class CommandRunner:
+    def __init__(self, limit=None):
+        self.set_limit(limit)
+        self.console = threading.Lock()
+        self.log_lock = threading.Lock()
+        self.log_file = None
+        self.active_lock = threading.Lock()
+        self.active = {}
+        self.cancelled = threading.Event()
+        # Numbers the commands so that the log lines of concurrent ones can be told apart
+        self.commands = itertools.count(1)
+
+    # Cap the number of commands running at the same time; None removes the cap
+    def set_limit(self, limit):
+        self.semaphore = threading.BoundedSemaphore(limit) if limit else None
+
+    # Start a new command log, replacing the one of the previous run
+    def open_log(self, path=LOG_FILE):
+        with self.log_lock:
+            if self.log_file is not None:
+                self.log_file.close()
+            self.log_file = open(path, "w", errors="replace")
+        self.cancelled.clear()
+
+    def close_log(self):
+        with self.log_lock:
+            if self.log_file is not None:
+                self.log_file.close()
+                self.log_file = None
+
+    # Write to the command log, every line prefixed with the number of the command it belongs to
+    def log(self, text, tag=None):
+        if tag is not None:
+            text = "".join(f"[{tag}] {line}" for line in text.splitlines(keepends=True))
+        if text and not text.endswith("\n"):
+            text += "\n"
+        with self.log_lock:
+            if self.log_file is not None:
+                self.log_file.write(text)
+                self.log_file.flush()
+
+    # Stop every running command and refuse new ones until the next log is opened
+    def cancel(self):
+        self.cancelled.set()
+        with self.active_lock:
+            active = list(self.active.values())
+        for loop, task in active:
+            loop.call_soon_threadsafe(task.cancel)
+
+    # Run a command and wait for it; output is echoed, logged and, with capture, kept in a ring buffer
+    def run(self, args, cwd=None, env=None, input=None, timeout=None, capture=False, echo=None, interactive=False, check=False, lines=CAPTURE_LINES):
+        args = [os.fspath(arg) if isinstance(arg, os.PathLike) else str(arg) for arg in args]
+        echo = not capture if echo is None else echo
+        if self.cancelled.is_set():
+            raise CommandCancelled(f"{shlex.join(args)} was not started")
+
+        # Only one interactive command owns the terminal at a time
+        with self.semaphore or nullcontext(), self.console if interactive else nullcontext():
+            result = asyncio.run(self.execute(args, cwd, env, input, timeout, capture, echo, interactive, lines))
+        if check:
+            result.check_returncode()
+        return result
+
+    async def execute(self, args, cwd, env, input, timeout, capture, echo, interactive, lines):
+        tag = next(self.commands)
+        self.log(f"$ {shlex.join(args)}\n", tag)
+        if interactive:
+            # The command talks to the terminal directly, so nothing is captured or logged
+            stdio = {}
+        else:
+            stdio = {"stdin": subprocess.PIPE if input is not None else subprocess.DEVNULL, "stdout": subprocess.PIPE, "stderr": subprocess.PIPE}
+        loop = asyncio.get_running_loop()
+        transport, protocol = await loop.subprocess_exec(lambda: ExitProtocol(CHUNK_SIZE, loop), *args, cwd=cwd, env=env, **stdio)
+        process = asyncio.subprocess.Process(transport, protocol, loop)
+
+        stdout = Capture(lines) if capture else None
+        stderr = Capture(lines) if capture else None
+        sizes = [0, 0]
+        # The exit future is shielded so that stop() can still wait on it after a timeout
+        work = [asyncio.shield(protocol.exited)]
+        pumps = []
+        if not interactive:
+            if input is not None:
+                work.append(self.feed(process.stdin, input))
+            pumps.append(asyncio.ensure_future(self.pump(process.stdout, stdout, sys.stdout if echo else None, sizes, 0, tag)))
+            pumps.append(asyncio.ensure_future(self.pump(process.stderr, stderr, sys.stderr if echo else None, sizes, 1, tag)))
+
+        task = asyncio.current_task()
+        with self.active_lock:
+            self.active[id(task)] = (loop, task)
+        try:
+            await asyncio.wait_for(asyncio.gather(*work), timeout)
+            # Collect the rest of the output, but do not wait for pipes inherited by a background process
+            if pumps:
+                await asyncio.wait(pumps, timeout=PIPE_GRACE)
+        except asyncio.TimeoutError:
+            await self.stop(process, protocol)
+            self.log(f"# timed out after {timeout}s\n", tag)
+            raise subprocess.TimeoutExpired(args, timeout, stdout and stdout.text(), stderr and stderr.text())
+        except asyncio.CancelledError:
+            await self.stop(process, protocol)
+            self.log("# cancelled\n", tag)
+            raise CommandCancelled(f"{shlex.join(args)} was cancelled")
+        finally:
+            with self.active_lock:
+                self.active.pop(id(task), None)
+            for pump in pumps:
+                pump.cancel()
+            transport.close()
+
+        self.log(f"# exit status {process.returncode}\n", tag)
+        return CommandResult(
+            args, process.returncode,
+            stdout.text() if stdout else None,
+            stderr.text() if stderr else None,
+            None if interactive else sum(sizes),
+            (stdout.dropped + stderr.dropped) if capture else 0,
+        )
+
+    # Write the input and close stdin so the command sees end of file
+    async def feed(self, stream, data):
+        try:
+            stream.write(data.encode() if isinstance(data, str) else data)
+            await stream.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            stream.close()
+
+    # Split a stream into lines and hand each one to the console, the log and the capture buffer
+    async def pump(self, stream, capture, console, sizes, index, tag):
+        partial = b""
+        while True:
+            chunk = await stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            sizes[index] += len(chunk)
+            *complete, partial = (partial + chunk).split(b"\n")
+            complete = [line + b"\n" for line in complete]
+            # A line without a newline, such as a progress bar, is not buffered forever
+            if len(partial) > MAX_LINE:
+                complete.append(partial)
+                partial = b""
+            self.emit(complete, capture, console, tag)
+        if partial:
+            self.emit([partial], capture, console, tag)
+
+    def emit(self, lines, capture, console, tag):
+        if not lines:
+            return
+        text = [line.decode(errors="replace") for line in lines]
+        if capture is not None:
+            for line in text:
+                capture.append(line)
+        joined = "".join(text)
+        if console is not None:
+            console.write(joined)
+            console.flush()
+        self.log(joined, tag)
+
+    # Ask a command to exit, then kill it when it does not
+    async def stop(self, process, protocol):
+        try:
+            process.terminate()
+        except ProcessLookupError:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(protocol.exited), KILL_GRACE)
+        except asyncio.TimeoutError:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await protocol.exited
+
+# Runner shared by every step of the current run
+runner = CommandRunner()
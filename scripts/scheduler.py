@@ -0,0 +1,138 @@
+# scheduler.py
+
+# Import necessary modules
+import os, traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from scripts.trace import tracer
+from scripts.runner import runner
+
+# A provisioning step with the resources it consumes and produces
+class Step:
+    def __init__(self, name, func, args=(), inputs=(), outputs=(), categories=(), cache=None):
+        self.name = name
+        self.func = func
+        self.args = tuple(args)
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        # Summary categories the step reports to, and the StepInputs that make it skippable
+        self.categories = tuple(categories)
+        self.cache = cache
+
+    # Run the step, or skip it when its inputs match the last successful run
+    def run(self, state=None):
+        from scripts.arch_linux import msg_dict, update_msg_dict
+
+        if state is not None and self.cache is not None and state.is_fresh(self.name, self.cache):
+            print(f"warning: {self.name} inputs unchanged -- cached")
+            for category in self.categories:
+                update_msg_dict(category, 'cached')
+            return 'cached'
+
+        self.func(*self.args)
+
+        # Steps report errors through their summary categories rather than by raising
+        failed = any('failed' in msg_dict[category] for category in self.categories)
+        if state is not None and self.cache is not None:
+            if failed:
+                state.forget(self.name)
+            else:
+                state.record(self.name, self.cache)
+        return 'failed' if failed else 'done'
+
+    # Run the step inside a timed span of the trace
+    def traced_run(self, state=None):
+        with tracer.span(self.name, "step") as record:
+            result = self.run(state)
+            record["status"] = result
+            return result
+
+    def __repr__(self):
+        return f"Step({self.name!r})"
+
+# Default number of workers used when --jobs is not given
+def default_jobs():
+    return min(8, os.cpu_count() or 1)
+
+# Resolve the steps each step waits for by matching its inputs against the outputs of other steps
+def build_graph(steps, provided=()):
+    producers = {}
+    for step in steps:
+        for resource in step.outputs:
+            if resource in producers:
+                raise ValueError(f"resource '{resource}' is produced by both {producers[resource].name} and {step.name}")
+            producers[resource] = step
+
+    graph = {}
+    for step in steps:
+        deps = set()
+        for resource in step.inputs:
+            # Resources made available before the run, e.g. by host level steps of a fleet
+            if resource in provided:
+                continue
+            if resource not in producers:
+                raise ValueError(f"{step.name} needs '{resource}' but no step produces it")
+            if producers[resource] is not step:
+                deps.add(producers[resource].name)
+        graph[step.name] = deps
+
+    # Reject cycles up front so the scheduler can never stall
+    visiting, done = set(), set()
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"dependency cycle detected at {name}")
+        visiting.add(name)
+        for dep in graph[name]:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+    for name in graph:
+        visit(name)
+
+    return graph
+
+# Run the steps on a worker pool, starting each one as soon as everything it needs is ready
+def run_steps(steps, jobs=None, state=None, provided=()):
+    graph = build_graph(steps, provided)
+    by_name = {step.name: step for step in steps}
+    pending = {name: set(deps) for name, deps in graph.items()}
+    status = {}
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs or default_jobs())) as pool:
+        try:
+            while pending or running:
+                # Skip every step whose dependency did not complete
+                for name, deps in list(pending.items()):
+                    broken = [dep for dep in deps if status.get(dep) in ('failed', 'skipped')]
+                    if broken:
+                        print(f"warning: {name} skipped -- {', '.join(sorted(broken))} did not complete")
+                        status[name] = 'skipped'
+                        del pending[name]
+
+                # Submit every step whose dependencies have all finished
+                for name, deps in list(pending.items()):
+                    if all(status.get(dep) in ('done', 'cached') for dep in deps):
+                        running[pool.submit(by_name[name].traced_run, state)] = name
+                        del pending[name]
+
+                if not running:
+                    continue
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        status[name] = future.result()
+                    except Exception as e:
+                        print(f"Error: {name} failed -- {e}")
+                        traceback.print_exc()
+                        status[name] = 'failed'
+        except KeyboardInterrupt:
+            # Stop the commands of running steps so the pool can shut down
+            print("warning: interrupted -- stopping running commands")
+            runner.cancel()
+            raise
+
+    return status
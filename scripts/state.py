@@ -0,0 +1,100 @@
+# state.py
+
+# Import necessary modules
+import os, json, glob, hashlib, threading, time
+
+# Name of the state file kept in the provisioning root
+STATE_FILE = ".build_state.json"
+
+# Hash the content of a file in chunks
+def file_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Identify a file or folder by inode and modification time, so a recreated artifact is noticed
+def stat_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_ino, stat.st_mtime_ns]
+
+# The inputs a step reads, used to decide whether it has to run again
+class StepInputs:
+    def __init__(self, env_path=None, keys=(), files=(), artifacts=(), values=()):
+        self.env_path = env_path
+        self.keys = tuple(keys)
+        self.files = tuple(files)
+        self.artifacts = tuple(artifacts)
+        self.values = tuple(values)
+
+    # Compute a content hash over the .env keys, files and fixed values the step depends on
+    def fingerprint(self):
+        from scripts.arch_linux import get_env_data
+
+        digest = hashlib.sha256()
+        for key in sorted(self.keys):
+            digest.update(f"env:{key}={get_env_data(self.env_path, key, None)}\n".encode())
+        for value in self.values:
+            digest.update(f"value:{value}\n".encode())
+        for pattern in self.files:
+            matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+            for file_path in matches:
+                content = file_digest(file_path) if os.path.isfile(file_path) else "missing"
+                digest.update(f"file:{file_path}={content}\n".encode())
+        return digest.hexdigest()
+
+    # Record the identity of every artifact the step leaves behind
+    def artifact_signatures(self):
+        return {path: stat_signature(path) for path in self.artifacts}
+
+# Persistent record of the inputs each step last ran successfully with
+class StateStore:
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as file:
+                    self.entries = json.load(file).get("steps", {})
+            except (OSError, ValueError) as e:
+                print(f"warning: ignoring unreadable state file {path} -- {e}")
+
+    # Check whether a step's inputs and artifacts match its last successful run
+    def is_fresh(self, name, inputs):
+        with self.lock:
+            entry = self.entries.get(name)
+        if not entry:
+            return False
+        signatures = inputs.artifact_signatures()
+        if any(signature is None for signature in signatures.values()):
+            return False
+        return entry.get("fingerprint") == inputs.fingerprint() and entry.get("artifacts") == signatures
+
+    # Remember the inputs a step completed with and write the store back to disk
+    def record(self, name, inputs):
+        entry = {
+            "fingerprint": inputs.fingerprint(),
+            "artifacts": inputs.artifact_signatures(),
+            "updated": time.time(),
+        }
+        with self.lock:
+            self.entries[name] = entry
+            self.save()
+
+    # Forget a step so that it runs on the next provision
+    def forget(self, name):
+        with self.lock:
+            if self.entries.pop(name, None) is not None:
+                self.save()
+
+    # Write the state through a temporary file so a crash never leaves it half written
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"steps": self.entries}, file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,198 @@
+# trace.py
+
+# Import necessary modules
+import os, json, time, shlex, sqlite3, resource, threading, subprocess, statistics
+from contextlib import contextmanager
+from scripts.cache import cache_dir
+from scripts.runner import runner
+
+# Name of the timeline written to the provisioning root after every run
+TRACE_FILE = ".build_trace.json"
+
+# Get a readable name for a command given as a string or an argv list
+def command_name(command, limit=120):
+    name = command if isinstance(command, str) else shlex.join(str(part) for part in command)
+    return name if len(name) <= limit else name[:limit - 3] + "..."
+
+# Collects timed spans for steps and commands
+class Tracer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    # Start a new run
+    def reset(self):
+        with self.lock:
+            self.spans = []
+            self.started = time.time()
+            self.origin = time.perf_counter()
+
+    # Time a block of work; the yielded dict can be filled with extra fields
+    @contextmanager
+    def span(self, name, kind, **fields):
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        record = dict(fields)
+        try:
+            yield record
+        except BaseException:
+            record.setdefault("status", "failed")
+            raise
+        finally:
+            record.update({
+                "name": name,
+                "kind": kind,
+                "start": start - self.origin,
+                "wall": time.perf_counter() - start,
+                "cpu": record.get("cpu", time.thread_time() - cpu_start),
+                "thread": threading.get_ident(),
+            })
+            with self.lock:
+                self.spans.append(record)
+
+    # Run a command through the runner with the wall time, child CPU time, exit code and output size recorded
+    def run(self, args, check=False, **kwargs):
+        with self.span(command_name(args), "command") as record:
+            # Children of concurrent steps share the counters, so this is an upper bound under --jobs > 1
+            usage_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+            try:
+                result = runner.run(args, **kwargs)
+            except subprocess.TimeoutExpired:
+                record["status"] = "timeout"
+                raise
+            finally:
+                usage_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+                record["cpu"] = (usage_end.ru_utime - usage_start.ru_utime) + (usage_end.ru_stime - usage_start.ru_stime)
+            record["exit_code"] = result.returncode
+            record["output_bytes"] = result.output_bytes
+            if result.dropped_lines:
+                record["dropped_lines"] = result.dropped_lines
+            if check:
+                result.check_returncode()
+            return result
+
+    # Wall time of every step, in the order the steps finished
+    def step_times(self):
+        with self.lock:
+            return {span["name"]: span["wall"] for span in self.spans if span["kind"] == "step"}
+
+    # Build a Chrome trace (chrome://tracing, Perfetto) of the run
+    def chrome_trace(self):
+        with self.lock:
+            spans = list(self.spans)
+        events = []
+        for span in spans:
+            args = {key: value for key, value in span.items() if key not in ("name", "kind", "start", "wall", "thread")}
+            events.append({
+                "name": span["name"],
+                "cat": span["kind"],
+                "ph": "X",
+                "ts": round(span["start"] * 1e6),
+                "dur": round(span["wall"] * 1e6),
+                "pid": os.getpid(),
+                "tid": span["thread"],
+                "args": args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"started": self.started}}
+
+    # Write the Chrome trace to a file
+    def export(self, path=TRACE_FILE):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self.chrome_trace(), file)
+        os.replace(tmp_path, path)
+        return path
+
+# Tracer shared by every step of the current run
+tracer = Tracer()
+
+# Run a command with the shared runner and record it in the trace
+def run_process(args, **kwargs):
+    return tracer.run(args, **kwargs)
+
+# Open the run-history database, creating its tables when needed
+def open_history(path=None):
+    connection = sqlite3.connect(path or os.path.join(cache_dir(), "history.db"), timeout=30)
+    connection.executescript("""
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started REAL NOT NULL,
+            wall REAL NOT NULL,
+            project TEXT,
+            jobs INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS spans (
+            run_id INTEGER NOT NULL REFERENCES runs(id),
+            name TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            start REAL NOT NULL,
+            wall REAL NOT NULL,
+            cpu REAL,
+            exit_code INTEGER,
+            output_bytes INTEGER,
+            status TEXT
+        );
+        CREATE INDEX IF NOT EXISTS spans_run ON spans(run_id);
+    """)
+    return connection
+
+# Append the spans of a finished run to the history database
+def record_run(trace=tracer, project=None, jobs=None, path=None):
+    with trace.lock:
+        spans = list(trace.spans)
+        wall = time.perf_counter() - trace.origin
+    connection = open_history(path)
+    try:
+        with connection:
+            cursor = connection.execute("INSERT INTO runs (started, wall, project, jobs) VALUES (?, ?, ?, ?)", (trace.started, wall, project, jobs))
+            connection.executemany(
+                "INSERT INTO spans (run_id, name, kind, start, wall, cpu, exit_code, output_bytes, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(cursor.lastrowid, span["name"], span["kind"], span["start"], span["wall"], span.get("cpu"), span.get("exit_code"), span.get("output_bytes"), span.get("status")) for span in spans],
+            )
+        return cursor.lastrowid
+    finally:
+        connection.close()
+
+# Print the slowest steps and commands of the last run and the steps that regressed against earlier runs
+def print_report(limit=10, baseline_runs=10, threshold=1.25, min_delta=0.5, path=None):
+    connection = open_history(path)
+    try:
+        runs = connection.execute("SELECT id, started, wall, project FROM runs ORDER BY id DESC LIMIT ?", (baseline_runs + 1,)).fetchall()
+        if not runs:
+            print("No provisioning runs recorded yet.")
+            return []
+
+        run_id, started, wall, project = runs[0]
+        print(f"Run {run_id} ({project or 'unknown project'}) at {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started))} -- {wall:.2f}s")
+
+        for kind in ("step", "command"):
+            rows = connection.execute("SELECT name, wall, cpu, exit_code, output_bytes FROM spans WHERE run_id = ? AND kind = ? ORDER BY wall DESC LIMIT ?", (run_id, kind, limit)).fetchall()
+            if rows:
+                print(f"\nSlowest {kind}s:")
+                for name, span_wall, cpu, exit_code, output_bytes in rows:
+                    extra = "" if exit_code is None else f" exit={exit_code}"
+                    extra += "" if output_bytes is None else f" output={output_bytes}B"
+                    print(f"  {span_wall:8.2f}s  cpu {cpu or 0:6.2f}s  {name}{extra}")
+
+        # Compare each step against its median over the previous runs
+        regressions = []
+        previous = [row[0] for row in runs[1:]]
+        if previous:
+            placeholders = ",".join("?" for _ in previous)
+            history = {}
+            for name, span_wall in connection.execute(f"SELECT name, wall FROM spans WHERE kind = 'step' AND run_id IN ({placeholders})", previous):
+                history.setdefault(name, []).append(span_wall)
+            for name, span_wall in connection.execute("SELECT name, wall FROM spans WHERE kind = 'step' AND run_id = ?", (run_id,)):
+                if name in history:
+                    baseline = statistics.median(history[name])
+                    if span_wall > baseline * threshold and span_wall - baseline > min_delta:
+                        regressions.append((name, baseline, span_wall))
+
+        print(f"\nRegressions against the median of the previous {len(previous)} run(s):")
+        if not regressions:
+            print("  none")
+        for name, baseline, span_wall in sorted(regressions, key=lambda item: item[2] - item[1], reverse=True):
+            print(f"  {name}: {baseline:.2f}s -> {span_wall:.2f}s (+{span_wall - baseline:.2f}s)")
+        return regressions
+    finally:
+        connection.close()
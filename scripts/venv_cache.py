@@ -0,0 +1,140 @@
+# venv_cache.py
+
+# Import necessary modules
+import os, re, sys, glob, shlex, platform
+from scripts.cache import cache_dir, hash_inputs, link_tree, rewrite_file, remove_entry, touch, evict_lru, tmp_name, cache_lock, offline_mode
+
+# File inside a venv recording which requirements it was built from
+STAMP_FILE = ".requirements-key"
+
+# Default size cap of the venv template and wheel caches
+DEFAULT_MAX_MB = 4096
+
+# Key a requirements file together with the Python version that installs it
+def requirements_key(requirements_path):
+    return hash_inputs([requirements_path], [sys.version, platform.machine()])
+
+# Read the key a venv was last built from
+def read_stamp(venv_dir):
+    try:
+        with open(os.path.join(venv_dir, STAMP_FILE), "r") as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+# Record the key a venv was built from, replacing the file so a template sharing it stays intact
+def write_stamp(venv_dir, key):
+    stamp_path = os.path.join(venv_dir, STAMP_FILE)
+    with open(f"{stamp_path}.tmp", "w") as file:
+        file.write(key)
+    os.replace(f"{stamp_path}.tmp", stamp_path)
+
+# Point the scripts and config of a copied venv at the location it will be used from
+def relocate_venv(venv_dir, old_dir, new_dir=None):
+    old, new = os.path.abspath(old_dir).encode(), os.path.abspath(new_dir or venv_dir).encode()
+    rewrite_file(os.path.join(venv_dir, "pyvenv.cfg"), old, new)
+    bin_dir = os.path.join(venv_dir, "bin")
+    for name in os.listdir(bin_dir):
+        file_path = os.path.join(bin_dir, name)
+        if os.path.isfile(file_path) and not os.path.islink(file_path):
+            rewrite_file(file_path, old, new)
+
+# Replace a venv with a linked copy of a cached template
+def materialize_venv(template_dir, venv_dir):
+    remove_entry(venv_dir)
+    link_tree(template_dir, venv_dir)
+    relocate_venv(venv_dir, template_dir)
+
+# Store a linked copy of a venv as the template for its key
+def store_template(venv_dir, template_dir):
+    if os.path.exists(template_dir):
+        return
+    staging_dir = tmp_name(template_dir)
+    link_tree(venv_dir, staging_dir)
+    relocate_venv(staging_dir, venv_dir, template_dir)
+    try:
+        os.rename(staging_dir, template_dir)
+    except OSError:
+        # Another run stored the same template first
+        remove_entry(staging_dir)
+
+# Normalize a distribution name the way wheel file names are, so that ruamel.yaml is ruamel_yaml
+def normalize_name(name):
+    return re.sub(r"[-_.]+", "_", name).lower()
+
+# Normalized names of the distributions installed in a venv
+def installed_names(venv_dir):
+    names = set()
+    for site_dir in glob.glob(os.path.join(venv_dir, "lib", "python*", "site-packages")):
+        for entry in os.listdir(site_dir):
+            if entry.endswith(".dist-info"):
+                names.add(normalize_name(entry.split("-", 1)[0]))
+    return names
+
+# Wheels of the wheelhouse that a venv was installed from
+def venv_wheels(venv_dir, wheelhouse):
+    names = installed_names(venv_dir)
+    return sorted(os.path.join(wheelhouse, wheel) for wheel in os.listdir(wheelhouse) if wheel.endswith(".whl") and normalize_name(wheel.split("-", 1)[0]) in names)
+
+# Mark every wheel a venv was installed from as recently used, dependencies included
+def touch_wheels(venv_dir, wheelhouse):
+    for wheel in venv_wheels(venv_dir, wheelhouse):
+        touch(wheel)
+
+# Command pip is run as inside a venv; BUILD_PIP replaces it, as the benchmarks do with a stub
+def pip_command(python):
+    return shlex.split(os.environ["BUILD_PIP"]) if os.environ.get("BUILD_PIP") else [python, "-m", "pip"]
+
+# Link the cached template in place when one was built from the same requirements
+def restore_template(template_dir, venv_dir):
+    if not os.path.exists(os.path.join(template_dir, STAMP_FILE)):
+        return False
+    materialize_venv(template_dir, venv_dir)
+    touch(template_dir)
+    return True
+
+# Bring a venv in line with a requirements file using the local template and wheel caches
+def prepare_venv(venv_dir, requirements_path, run_command, max_mb=DEFAULT_MAX_MB):
+    key = requirements_key(requirements_path)
+
+    # Nothing to do when the venv was already built from these requirements
+    if read_stamp(venv_dir) == key:
+        return 'current'
+
+    template_dir = os.path.join(cache_dir("venvs"), key)
+    wheelhouse = cache_dir("wheels")
+
+    # A template built from the same requirements can simply be linked in place
+    with cache_lock(f"venvs-{key}", shared=True):
+        restored = restore_template(template_dir, venv_dir)
+    if restored:
+        touch_wheels(venv_dir, wheelhouse)
+        return 'restored'
+
+    # Only one process builds a given template; the others wait and link its result
+    with cache_lock(f"venvs-{key}"):
+        if restore_template(template_dir, venv_dir):
+            touch_wheels(venv_dir, wheelhouse)
+            return 'restored'
+
+        # Build missing wheels once, then install only what the venv does not have yet
+        python = os.path.join(venv_dir, "bin", "python")
+        # Offline, the wheelhouse imported from a bundle already holds every wheel
+        if not offline_mode():
+            with cache_lock("wheels"):
+                if run_command([*pip_command(python), "wheel", "-q", "-r", requirements_path, "-w", wheelhouse, "--find-links", wheelhouse]) is None:
+                    return None
+        with cache_lock("wheels", shared=True):
+            if run_command([*pip_command(python), "install", "--no-index", "--find-links", wheelhouse, "-r", requirements_path]) is None:
+                return None
+
+        write_stamp(venv_dir, key)
+        store_template(venv_dir, template_dir)
+    touch_wheels(venv_dir, wheelhouse)
+
+    # Keep both caches under the size cap, never evicting what this run uses
+    max_bytes = max_mb * 1024 * 1024
+    evict_lru(cache_dir("venvs"), max_bytes // 2, keep=[key], lock_prefix="venvs")
+    with cache_lock("wheels"):
+        evict_lru(wheelhouse, max_bytes // 2)
+    return 'installed'
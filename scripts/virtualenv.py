@@ -0,0 +1,56 @@
+# virtualenv.py
+
+# Import necessary modules
+import os, sys, glob, venv, zipfile, ensurepip
+from scripts.trace import run_process
+
+# Folder of the venv's site-packages for the running Python version
+def site_packages(venv_dir):
+    return os.path.join(venv_dir, "lib", f"python{sys.version_info.major}.{sys.version_info.minor}", "site-packages")
+
+# Find the pip wheel bundled with the running Python
+def bundled_pip_wheel():
+    wheels = sorted(glob.glob(os.path.join(os.path.dirname(ensurepip.__file__), "_bundled", "pip-*.whl")))
+    return wheels[-1] if wheels else None
+
+# Write the pip console scripts into the venv's bin folder
+def write_pip_scripts(venv_dir):
+    python = os.path.join(os.path.abspath(venv_dir), "bin", "python")
+    script = f"#!{python}\nimport sys\nfrom pip._internal.cli.main import main\nif __name__ == '__main__':\n    sys.exit(main())\n"
+    for name in ("pip", "pip3", f"pip{sys.version_info.major}.{sys.version_info.minor}"):
+        path = os.path.join(venv_dir, "bin", name)
+        with open(path, "w") as file:
+            file.write(script)
+        os.chmod(path, 0o755)
+
+# Seed pip by unpacking the bundled wheel, which avoids starting ensurepip in a child process
+def seed_pip(venv_dir):
+    wheel = bundled_pip_wheel()
+    if wheel is None:
+        # Some distributions strip the bundled wheels, fall back to ensurepip
+        return run_process([os.path.join(venv_dir, "bin", "python"), "-m", "ensurepip", "--upgrade", "--default-pip"], timeout=600).returncode == 0
+    with zipfile.ZipFile(wheel) as archive:
+        archive.extractall(site_packages(venv_dir))
+    write_pip_scripts(venv_dir)
+    return True
+
+# Create a virtual environment in-process through the venv API
+def create_venv(venv_dir, symlinks=True, with_pip=False, seed=True):
+    builder = venv.EnvBuilder(symlinks=symlinks, with_pip=with_pip, clear=False)
+    builder.create(venv_dir)
+    if seed and not with_pip:
+        return seed_pip(venv_dir)
+    return True
+
+# Compute the environment an activated venv would have, without touching os.environ
+def activation_env(venv_dir, base=None):
+    env = dict(os.environ if base is None else base)
+    venv_path = os.path.abspath(venv_dir)
+    bin_dir = os.path.join(venv_path, "bin")
+
+    # Prepend the venv's bin folder once, even when computed repeatedly
+    path = [entry for entry in env.get("PATH", "").split(os.pathsep) if entry and entry != bin_dir]
+    env["PATH"] = os.pathsep.join([bin_dir] + path)
+    env["VIRTUAL_ENV"] = venv_path
+    env.pop("PYTHONHOME", None)
+    return env
@@ -0,0 +1,225 @@
+# watch.py
+
+# Import necessary modules
+import os, glob, time, errno, select, struct, fnmatch, ctypes, ctypes.util
+
+# inotify event flags, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Events that mean a file was written, replaced or removed; editors often save through a rename
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT = struct.Struct("iIII")
+
+# Seconds without further changes before a burst of changes is handled, and the longest a burst is held back
+DEBOUNCE = 0.3
+MAX_DELAY = 3.0
+
+# Seconds between two scans of the polling watcher
+POLL_INTERVAL = 1.0
+
+# Folders that are never watched, as they only hold generated files
+IGNORED_DIRS = {".git", "__pycache__", "node_modules", "venv", ".venv"}
+
+# Temporary files editors write next to the file being saved
+IGNORED_FILES = ["*.swp", "*.swx", "*~", ".#*", "4913", "*.tmp"]
+
+# Check whether a path matches a glob pattern, where "**/" also matches no folder at all
+def matches(path, pattern):
+    path, pattern = os.path.normpath(path), os.path.normpath(pattern)
+    return fnmatch.fnmatchcase(path, pattern) or ("**/" in pattern and fnmatch.fnmatchcase(path, pattern.replace("**/", "")))
+
+# Folder a pattern can be watched from, and whether the files below it are matched at any depth
+def pattern_root(pattern):
+    parts = os.path.normpath(pattern).split(os.sep)
+    static = []
+    for part in parts[:-1]:
+        if glob.has_magic(part):
+            break
+        static.append(part)
+    root = os.sep.join(static) or ("/" if pattern.startswith("/") else ".")
+    return root, len(static) < len(parts) - 1
+
+# Check whether a changed path is a file worth reacting to
+def interesting(path):
+    name = os.path.basename(path)
+    if any(fnmatch.fnmatchcase(name, pattern) for pattern in IGNORED_FILES):
+        return False
+    return not any(part in IGNORED_DIRS for part in os.path.normpath(path).split(os.sep))
+
+# Common part of the watchers: collect changes until a burst of them settles
+class Watcher:
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+
+    # Paths changed since the last call, waiting at most timeout seconds for the first one
+    def poll(self, timeout):
+        raise NotImplementedError
+
+    # Block until something changed, then return every path changed in the same burst
+    def wait(self, debounce=DEBOUNCE, max_delay=MAX_DELAY):
+        changed = set()
+        while not changed:
+            changed.update(self.poll(None))
+        deadline = time.monotonic() + max_delay
+        while time.monotonic() < deadline:
+            more = self.poll(min(debounce, max(0.0, deadline - time.monotonic())))
+            if not more:
+                break
+            changed.update(more)
+        return {path for path in changed if interesting(path)}
+
+    def close(self):
+        pass
+
+# Watcher based on inotify, called through libc
+class InotifyWatcher(Watcher):
+    def __init__(self, patterns):
+        super().__init__(patterns)
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.folders = {}
+        self.roots = [pattern_root(pattern) for pattern in self.patterns]
+        for root, recursive in self.roots:
+            self.add_root(root, recursive)
+
+    # Watch a folder, or its closest existing parent until the folder is created
+    def add_root(self, root, recursive):
+        folder = root
+        while not os.path.isdir(folder) and os.path.dirname(folder) not in ("", folder):
+            folder = os.path.dirname(folder)
+        if folder == root and recursive:
+            self.add_tree(root)
+        else:
+            self.add_folder(folder if os.path.isdir(folder) else ".")
+
+    # Watch a folder and every folder below it; returns the files already in them
+    def add_tree(self, root):
+        found = set()
+        for folder, dirs, files in os.walk(root):
+            dirs[:] = [name for name in dirs if name not in IGNORED_DIRS]
+            self.add_folder(folder)
+            found.update(os.path.join(folder, name) for name in files)
+        return found
+
+    def add_folder(self, folder):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            # Too many watches is not fatal, the folder is simply not watched
+            if error not in (errno.ENOENT, errno.ENOTDIR, errno.ENOSPC):
+                raise OSError(error, f"inotify_add_watch failed for {folder}")
+            return
+        self.folders[wd] = folder
+
+    # Start watching a folder created after the watch began when a pattern can match below it;
+    # files written into it before the watch was added are reported as changed
+    def folder_created(self, path):
+        for root, recursive in self.roots:
+            inside = os.path.relpath(path, root) if root != "." else path
+            if recursive and not inside.startswith(".."):
+                return self.add_tree(path)
+            if root == path or root.startswith(path.rstrip(os.sep) + os.sep):
+                self.add_root(root, recursive)
+                return self.add_tree(root) if os.path.isdir(root) else set()
+        return set()
+
+    def poll(self, timeout):
+        poller = select.poll()
+        poller.register(self.fd, select.POLLIN)
+        if not poller.poll(None if timeout is None else int(timeout * 1000)):
+            return set()
+
+        changed = set()
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset + EVENT.size <= len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b"\0")
+            offset += EVENT.size + length
+
+            # Lost events: every pattern may have changed
+            if mask & IN_Q_OVERFLOW:
+                changed.update(self.patterns)
+                continue
+            folder = self.folders.get(wd)
+            if folder is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.folders[wd]
+                continue
+            path = os.path.normpath(os.path.join(folder, os.fsdecode(name))) if name else folder
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    changed.update(self.folder_created(path))
+                continue
+            changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+# Watcher that compares the size and modification time of the matching files on every scan
+class PollingWatcher(Watcher):
+    def __init__(self, patterns, interval=POLL_INTERVAL):
+        super().__init__(patterns)
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def scan(self):
+        snapshot = {}
+        for pattern in self.patterns:
+            paths = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+            for path in paths:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[os.path.normpath(path)] = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def poll(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self.scan()
+            changed = {path for path in snapshot.keys() | self.snapshot.keys() if snapshot.get(path) != self.snapshot.get(path)}
+            self.snapshot = snapshot
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            time.sleep(self.interval if deadline is None else max(0.0, min(self.interval, deadline - time.monotonic())))
+
+# Watch the files matching the patterns with inotify, falling back to polling where it is unavailable
+def create_watcher(patterns, polling=False):
+    if not polling:
+        try:
+            return InotifyWatcher(patterns)
+        except (OSError, AttributeError) as e:
+            print(f"warning: inotify unavailable ({e}) -- polling every {POLL_INTERVAL:.0f}s")
+    return PollingWatcher(patterns)
+
+# Steps to run again for a set of changed paths, given (patterns, step names) rules
+def affected_steps(changed, rules):
+    names = []
+    for patterns, steps in rules:
+        if any(matches(path, pattern) for path in changed for pattern in patterns):
+            names += [name for name in steps if name not in names]
+    return names